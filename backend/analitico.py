@@ -0,0 +1,78 @@
+import numpy as np
+
+from backend.proventos import CHAVES
+
+
+def divisao_segura(num, den):
+    """num / den coluna a coluna, com 0 onde den == 0 (den nulo continua dando nulo)."""
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den != 0, num / den, 0.0)
+
+
+def agregar_operacoes(notas, chaves=CHAVES):
+    """Soma compras, vendas e prêmios de `notas` por `chaves` num único groupby.
+
+    Cada nota vira uma coluna por métrica (zero quando não se aplica), então todas
+    as métricas saem do mesmo agrupamento, sem merges entre grupos.
+    """
+    acao = (notas['tipo_papel'] == 'ACAO').to_numpy()
+    opcao = (notas['tipo_papel'] == 'OPCAO').to_numpy()
+    compra = (notas['tipo_lado'] == 'C').to_numpy()
+    venda = (notas['tipo_lado'] == 'V').to_numpy()
+    quantidade = notas['quantidade'].to_numpy(dtype=float)
+    valor = notas['valor_operacao'].to_numpy(dtype=float)
+
+    colunas = notas[chaves].copy()
+    colunas['data_inicio'] = notas['data_registro']
+    colunas['Quantidade_comprada'] = np.where(acao & compra, quantidade, 0.0)
+    colunas['Total_compras'] = np.where(acao & compra, valor, 0.0)
+    colunas['Quantidade_vendida'] = np.where(acao & venda, quantidade, 0.0)
+    colunas['Total_vendas'] = np.where(acao & venda, valor, 0.0)
+    colunas['Premios_recebidos'] = np.where(opcao & venda, valor, 0.0)
+    colunas['Premios_pagos'] = np.where(opcao & compra, valor, 0.0)
+
+    consolidado = colunas.groupby(chaves).agg(
+        data_inicio=('data_inicio', 'min'),
+        Quantidade_comprada=('Quantidade_comprada', 'sum'),
+        Total_compras=('Total_compras', 'sum'),
+        Quantidade_vendida=('Quantidade_vendida', 'sum'),
+        Total_vendas=('Total_vendas', 'sum'),
+        Premios_recebidos=('Premios_recebidos', 'sum'),
+        Premios_pagos=('Premios_pagos', 'sum'),
+    ).reset_index()
+
+    consolidado['preco_medio'] = divisao_segura(consolidado['Total_compras'], consolidado['Quantidade_comprada'])
+    consolidado['quantidade_atual'] = consolidado['Quantidade_comprada'] - consolidado['Quantidade_vendida']
+    consolidado['Premio_liquido'] = consolidado['Premios_recebidos'] - consolidado['Premios_pagos']
+    return consolidado
+
+
+def calcular_metricas(consolidado):
+    """Acrescenta posição, resultado e rentabilidades a um consolidado com preços e proventos."""
+    c = consolidado
+    c['Posicao_atual'] = c['quantidade_atual'] * c['preco_fechamento']
+    c['investido'] = c['quantidade_atual'] * c['preco_medio']
+
+    c['resultado_sem_opcoes'] = c['Posicao_atual'] - c['investido']
+    c['resultado_com_opcoes'] = c['resultado_sem_opcoes'] + c['Premio_liquido']
+
+    c['Rentabilidade_sem_premio'] = divisao_segura(
+        c['Total_vendas'] + c['Posicao_atual'] - c['Total_compras'], c['Total_compras'])
+    c['Rentabilidade_com_premio'] = divisao_segura(
+        c['Total_vendas'] + c['Posicao_atual'] + c['Premio_liquido'] - c['Total_compras'], c['Total_compras'])
+    c['Rentabilidade_com_proventos'] = divisao_segura(
+        c['Total_vendas'] + c['Posicao_atual'] + c['Proventos'] - c['Total_compras'], c['Total_compras'])
+    c['Rentabilidade_com_proventos_premios'] = divisao_segura(
+        c['Total_vendas'] + c['Posicao_atual'] + c['Proventos'] + c['Premio_liquido'] - c['Total_compras'],
+        c['Total_compras'])
+
+    # Preço médio de venda e rentabilidade em reais das vendas (sem e com prêmios recebidos)
+    c['preco_medio_vendas'] = divisao_segura(c['Total_vendas'], c['Quantidade_vendida'])
+    c['rentabilidade_venda_sem_premio'] = (c['preco_medio_vendas'] - c['preco_medio']) * c['Quantidade_vendida']
+    c['rentabilidade_venda_com_premio'] = c['rentabilidade_venda_sem_premio'] + c['Premios_recebidos']
+
+    c['variacao_ativo'] = divisao_segura(
+        c['preco_fechamento'] - c['preco_fechamento_inicio_operacoes'], c['preco_fechamento_inicio_operacoes'])
+    return c
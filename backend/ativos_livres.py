@@ -0,0 +1,122 @@
+import pandas as pd
+from sqlalchemy import text
+
+from backend.cache_consultas import derivacao_em_dia, registrar_derivacao, versoes
+from backend.esquema import garantir_coluna, garantir_indice
+from backend.filtros import contendo, padrao_contendo
+
+COLUNAS_EXIBIR = ['Conta', 'Cliente', 'Ativo', 'Assessor', 'Qtde_Total', 'Qtde_Livre',
+                  'Preco_Medio', 'Preco_Atual', 'Volume_Livre', 'Rentabilidade']
+
+
+# Tabelas de que Preco_Atual, Rentabilidade e Volume_Livre dependem
+ORIGENS_DERIVADOS = ['ativos_yahoo', 'ativos_livres']
+
+
+def garantir_indices_ativos_livres(engine):
+    # Ordenação da tabela da página e filtros de igualdade dos dropdowns
+    garantir_indice(engine, 'ativos_livres', 'ix_ativos_livres_volume', ['Volume_Livre'])
+    garantir_indice(engine, 'ativos_livres', 'ix_ativos_livres_ativo', ['Ativo', 'Volume_Livre'])
+    garantir_indice(engine, 'ativos_livres', 'ix_ativos_livres_mesa', ['Mesa', 'Volume_Livre'])
+
+
+def _filtros(cliente=None, ativo=None, assessor=None, mesa=None, qtde_minima=0, volume_minimo=0):
+    # Sem COALESCE nos mínimos: com mínimo >= 0, nulo já fica de fora, e o índice continua utilizável
+    condicoes = ["Qtde_Livre > :qtde_minima", "Volume_Livre > :volume_minimo"]
+    params = {"qtde_minima": qtde_minima, "volume_minimo": volume_minimo}
+    if cliente:
+        condicoes.append(contendo("Cliente", "cliente"))
+        params["cliente"] = padrao_contendo(cliente)
+    if ativo:
+        condicoes.append("Ativo = :ativo")
+        params["ativo"] = ativo
+    if assessor:
+        condicoes.append(contendo("Assessor", "assessor"))
+        params["assessor"] = padrao_contendo(assessor)
+    if mesa:
+        condicoes.append("Mesa = :mesa")
+        params["mesa"] = mesa
+    return " AND ".join(condicoes), params
+
+
+def resumir_ativos_livres(engine, **filtros):
+    """Quantidade de linhas e volume livre total dos filtros, calculados no banco."""
+    where, params = _filtros(**filtros)
+    with engine.connect() as conn:
+        linhas, volume = conn.execute(
+            text(f"SELECT COUNT(*), COALESCE(SUM(Volume_Livre), 0) FROM ativos_livres WHERE {where}"), params
+        ).one()
+    return int(linhas), float(volume)
+
+
+def consultar_ativos_livres(engine, pagina=1, tamanho_pagina=100, **filtros):
+    """Uma página dos ativos livres filtrados, do maior para o menor volume livre."""
+    garantir_indices_ativos_livres(engine)
+    where, params = _filtros(**filtros)
+    params.update({"limite": tamanho_pagina, "inicio": (pagina - 1) * tamanho_pagina})
+    query = text(f"""
+        SELECT {', '.join(COLUNAS_EXIBIR)}
+        FROM ativos_livres
+        WHERE {where}
+        ORDER BY Volume_Livre DESC, Conta, Ativo
+        LIMIT :limite OFFSET :inicio
+    """)
+    return pd.read_sql(query, engine, params=params)
+
+
+# ------------------------------
+# Colunas derivadas
+# ------------------------------
+def garantir_chaves_normalizadas(engine):
+    """Ticker normalizado (UPPER/TRIM) gravado e indexado nas duas tabelas, para o JOIN usar índice."""
+    ok = True
+    for tabela, coluna, origem in [('ativos_livres', 'ativo_chave', 'Ativo'),
+                                   ('ativos_yahoo', 'asset_chave', 'asset_original')]:
+        ok = garantir_coluna(engine, tabela, coluna, f"VARCHAR(64) AS (UPPER(TRIM({origem}))) STORED") and ok
+        ok = ok and garantir_indice(engine, tabela, f"ix_{tabela}_{coluna}", [coluna])
+    return ok
+
+
+def recalcular_derivados(conn, chaves_normalizadas=True):
+    """Atualiza Preco_Atual, Rentabilidade e Volume_Livre de ativos_livres num único UPDATE.
+
+    Preco_Atual vem de ativos_yahoo (só para os ativos encontrados lá); as demais
+    colunas seguem as mesmas regras de antes: rentabilidade nula com preço médio
+    nulo ou zero, e volume só com quantidade e preço preenchidos.
+    """
+    juncao = ("ay.asset_chave = al.ativo_chave" if chaves_normalizadas
+              else "UPPER(TRIM(ay.asset_original)) = UPPER(TRIM(al.Ativo))")
+    # Num UPDATE de várias tabelas o MySQL não garante a ordem das atribuições,
+    # então o preço novo é repetido em cada expressão em vez de reler al.Preco_Atual
+    preco = "IF(ay.asset_original IS NULL, al.Preco_Atual, ay.preco_atual)"
+    return conn.execute(text(f"""
+        UPDATE ativos_livres AS al
+        LEFT JOIN ativos_yahoo AS ay ON {juncao}
+        SET al.Preco_Atual = {preco},
+            al.Rentabilidade = CASE
+                WHEN al.Preco_Medio IS NULL OR al.Preco_Medio = 0 THEN NULL
+                WHEN al.Preco_Medio > 0 AND {preco} IS NOT NULL
+                    THEN ROUND((({preco} - al.Preco_Medio) / al.Preco_Medio) * 100, 2)
+                ELSE al.Rentabilidade
+            END,
+            al.Volume_Livre = CASE
+                WHEN al.Qtde_livre IS NOT NULL AND {preco} IS NOT NULL THEN ROUND(al.Qtde_livre * {preco}, 2)
+                ELSE al.Volume_Livre
+            END
+    """)).rowcount
+
+
+def atualizar_derivados(engine, forcar=False):
+    """Recalcula as colunas derivadas só se ativos_yahoo ou ativos_livres mudaram desde a última vez.
+
+    Retorna True se o recálculo foi executado.
+    """
+    atuais = versoes(engine, ORIGENS_DERIVADOS)
+    if not forcar and derivacao_em_dia(engine, 'ativos_livres', atuais):
+        return False
+
+    chaves_normalizadas = garantir_chaves_normalizadas(engine)
+    with engine.begin() as conn:
+        recalcular_derivados(conn, chaves_normalizadas)
+    registrar_derivacao(engine, 'ativos_livres', atuais)
+    return True
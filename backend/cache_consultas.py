@@ -0,0 +1,94 @@
+import pandas as pd
+import streamlit as st
+from sqlalchemy import bindparam, text
+
+from backend.conexao import conectar
+from backend.esquema import garantir_tabela
+
+# Uma linha por tabela; a versão sobe a cada escrita e invalida os resultados em cache
+DDL_VERSOES = """
+    CREATE TABLE IF NOT EXISTS versoes_dados (
+        tabela VARCHAR(64) NOT NULL PRIMARY KEY,
+        versao BIGINT NOT NULL DEFAULT 0,
+        atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+# Versões das tabelas de origem usadas na última vez em que cada dado derivado foi recalculado
+DDL_DERIVACOES = """
+    CREATE TABLE IF NOT EXISTS derivacoes_dados (
+        nome VARCHAR(64) NOT NULL PRIMARY KEY,
+        versoes VARCHAR(255) NOT NULL,
+        atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+
+def incrementar_versao(engine, *tabelas):
+    """Marca `tabelas` como alteradas: consultas em cache que dependem delas são refeitas."""
+    garantir_tabela(engine, 'versoes_dados', DDL_VERSOES)
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO versoes_dados (tabela, versao) VALUES (:tabela, 1)
+                ON DUPLICATE KEY UPDATE versao = versao + 1
+            """),
+            [{"tabela": tabela} for tabela in tabelas]
+        )
+
+
+def versoes(engine, tabelas):
+    """Versão atual de cada tabela, na ordem de `tabelas` (0 se nunca foi alterada)."""
+    garantir_tabela(engine, 'versoes_dados', DDL_VERSOES)
+    query = text("SELECT tabela, versao FROM versoes_dados WHERE tabela IN :tabelas").bindparams(
+        bindparam("tabelas", expanding=True)
+    )
+    with engine.connect() as conn:
+        atuais = dict(conn.execute(query, {"tabelas": list(tabelas)}).fetchall())
+    return tuple(atuais.get(tabela, 0) for tabela in tabelas)
+
+
+def derivacao_em_dia(engine, nome, versoes_origem):
+    """True se `nome` já foi recalculado com exatamente estas versões das tabelas de origem."""
+    garantir_tabela(engine, 'derivacoes_dados', DDL_DERIVACOES)
+    with engine.connect() as conn:
+        aplicadas = conn.execute(
+            text("SELECT versoes FROM derivacoes_dados WHERE nome = :nome"), {"nome": nome}
+        ).scalar()
+    return aplicadas == ",".join(map(str, versoes_origem))
+
+
+def registrar_derivacao(engine, nome, versoes_origem):
+    garantir_tabela(engine, 'derivacoes_dados', DDL_DERIVACOES)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO derivacoes_dados (nome, versoes) VALUES (:nome, :versoes)
+            ON DUPLICATE KEY UPDATE versoes = VALUES(versoes)
+        """), {"nome": nome, "versoes": ",".join(map(str, versoes_origem))})
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _ler(sql, versoes_tabelas):
+    # versoes_tabelas só entra na chave do cache
+    return pd.read_sql(sql, conectar())
+
+
+def consulta_versionada(sql, tabelas):
+    """Resultado de `sql` compartilhado entre reruns e usuários até uma das `tabelas` mudar."""
+    return _ler(sql, versoes(conectar(), tabelas))
+
+
+# ------------------------------
+# Listas usadas nos filtros das páginas
+# ------------------------------
+def valores_distintos(tabela, coluna):
+    df = consulta_versionada(
+        f"SELECT DISTINCT {coluna} FROM {tabela} WHERE {coluna} IS NOT NULL ORDER BY {coluna}", [tabela]
+    )
+    return df[coluna].tolist()
+
+
+def anos_com_notas():
+    return consulta_versionada(
+        "SELECT DISTINCT YEAR(data_registro) AS ano FROM notas ORDER BY ano DESC", ['notas']
+    )['ano'].tolist()
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from backend.precos import buscar_cotacoes
+
+TTL_PADRAO = int(os.getenv("COTACAO_TTL_SEGUNDOS", 15 * 60))
+CAPACIDADE_PADRAO = int(os.getenv("COTACAO_CACHE_CAPACIDADE", 5000))
+
+
+class CacheCotacoes:
+    """Cache de cotações em dois níveis: LRU em memória e ativos_yahoo no banco.
+
+    Entradas dentro do TTL não vão à rede; entradas vencidas são servidas na hora
+    e revalidadas em segundo plano. Um ativo já em consulta não gera outra
+    requisição: quem chega depois aguarda o resultado em andamento.
+    """
+
+    def __init__(self, engine, provedor=None, ttl=TTL_PADRAO, capacidade=CAPACIDADE_PADRAO, max_workers=2):
+        self.engine = engine
+        self.provedor = provedor
+        self.ttl = ttl
+        self.capacidade = capacidade
+        self._itens = OrderedDict()  # asset -> (preco, instante da cotação)
+        self._em_consulta = {}       # asset -> Future com {asset: preco}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="revalidacao_cotacoes")
+        self.acertos = 0
+        self.faltas = 0
+        self.vencidos = 0
+
+    # ------------------------------
+    # Níveis do cache
+    # ------------------------------
+    def _guardar(self, itens):
+        with self._lock:
+            for asset, item in itens.items():
+                self._itens[asset] = item
+                self._itens.move_to_end(asset)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+    def _ler_banco(self, assets):
+        query = text("""
+            SELECT asset_original, preco_atual, data_atualizacao
+            FROM ativos_yahoo
+            WHERE asset_original IN :assets AND preco_atual IS NOT NULL
+        """).bindparams(bindparam("assets", expanding=True))
+        with self.engine.connect() as conn:
+            linhas = conn.execute(query, {"assets": list(assets)}).fetchall()
+
+        encontrados = {}
+        for asset, preco, data_atualizacao in linhas:
+            if data_atualizacao is None:
+                continue
+            # data_atualizacao é horário local; datas sem hora contam a partir da meia-noite
+            instante = pd.Timestamp(data_atualizacao).to_pydatetime().timestamp()
+            encontrados[asset] = (float(preco), instante)
+        return encontrados
+
+    # ------------------------------
+    # Consulta ao provedor
+    # ------------------------------
+    def _consultar(self, assets, ao_progredir=None):
+        from backend.importacao import atualizar_precos
+
+        precos = buscar_cotacoes(assets, self.provedor, ao_progredir=ao_progredir)
+        instante = time.time()
+        self._guardar({a: (p, instante) for a, p in precos.items() if p is not None})
+        atualizar_precos(self.engine, precos)
+        return precos
+
+    def _registrar_consulta(self, assets):
+        """Reserva para esta consulta os ativos que ninguém está consultando.
+
+        Retorna o Future da nova consulta, os ativos reservados e os Futures
+        das consultas já em andamento para os demais.
+        """
+        futuro = Future()
+        with self._lock:
+            novos = [a for a in assets if a not in self._em_consulta]
+            em_andamento = {self._em_consulta[a] for a in assets if a in self._em_consulta}
+            for asset in novos:
+                self._em_consulta[asset] = futuro
+        return futuro, novos, em_andamento
+
+    def _concluir_consulta(self, futuro, assets, funcao):
+        try:
+            futuro.set_result(funcao())
+        except Exception as e:
+            print(f"Erro ao consultar cotações: {e}")
+            futuro.set_result({})
+        finally:
+            with self._lock:
+                for asset in assets:
+                    if self._em_consulta.get(asset) is futuro:
+                        del self._em_consulta[asset]
+
+    def revalidar(self, assets):
+        futuro, novos, _ = self._registrar_consulta(assets)
+        if novos:
+            self._executor.submit(self._concluir_consulta, futuro, novos, lambda: self._consultar(novos))
+
+    # ------------------------------
+    # API
+    # ------------------------------
+    def obter_varios(self, assets, ao_progredir=None):
+        """Retorna {asset_original: preco} (None quando não há cotação)."""
+        return self.obter_varios_com_origem(assets, ao_progredir)[0]
+
+    def obter_varios_com_origem(self, assets, ao_progredir=None):
+        """Como obter_varios, mais {asset_original: origem} de cada preço.
+
+        Origem 'consultado' (buscado agora no provedor), 'cache' (dentro do TTL),
+        'vencido' (servido do cache e revalidado em segundo plano) ou None (sem cotação).
+        """
+        assets = list(dict.fromkeys(assets))
+        agora = time.time()
+        resultado, origens, vencidos = {}, {}, []
+
+        with self._lock:
+            em_memoria = {a: self._itens[a] for a in assets if a in self._itens}
+            for asset in em_memoria:
+                self._itens.move_to_end(asset)
+
+        faltantes = [a for a in assets if a not in em_memoria]
+        if faltantes:
+            do_banco = self._ler_banco(faltantes)
+            self._guardar(do_banco)
+            em_memoria.update(do_banco)
+
+        faltas = []
+        for asset in assets:
+            if asset not in em_memoria:
+                faltas.append(asset)
+                continue
+            preco, instante = em_memoria[asset]
+            resultado[asset] = preco
+            if agora - instante > self.ttl:
+                vencidos.append(asset)
+                origens[asset] = 'vencido'
+            else:
+                origens[asset] = 'cache'
+
+        with self._lock:
+            self.acertos += len(assets) - len(faltas) - len(vencidos)
+            self.vencidos += len(vencidos)
+            self.faltas += len(faltas)
+
+        if vencidos:
+            self.revalidar(vencidos)
+
+        if faltas:
+            futuro, novos, em_andamento = self._registrar_consulta(faltas)
+            precos = {}
+            if novos:
+                # Consulta na thread de quem chamou, para o progresso poder atualizar a página
+                self._concluir_consulta(futuro, novos, lambda: self._consultar(novos, ao_progredir))
+                precos.update(futuro.result())
+            for outro in em_andamento:
+                precos.update(outro.result())
+            for asset in faltas:
+                resultado[asset] = precos.get(asset)
+                origens[asset] = 'consultado' if resultado[asset] is not None else None
+
+        return resultado, origens
+
+    def obter(self, asset):
+        return self.obter_varios([asset])[asset]
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "vencidos": self.vencidos,
+                "itens": len(self._itens),
+                "em_consulta": len(self._em_consulta),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache_cotacoes(engine):
+    """Cache compartilhado por todas as sessões do processo."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheCotacoes(engine)
+        return _cache
@@ -0,0 +1,56 @@
+import pandas as pd
+from sqlalchemy import text
+
+
+def registros(df):
+    """Converte um DataFrame em parâmetros para executemany, com NaN/NaT como None."""
+    return df.astype(object).where(pd.notna(df), None).to_dict('records')
+
+
+def inserir_em_lotes(conn, tabela, df, tamanho_lote=5000):
+    """Insere `df` em `tabela` com INSERTs de várias linhas, dentro da transação de `conn`."""
+    if df.empty:
+        return 0
+    colunas = list(df.columns)
+    query = text(
+        f"INSERT INTO {tabela} ({', '.join(colunas)}) "
+        f"VALUES ({', '.join(':' + c for c in colunas)})"
+    )
+    for i in range(0, len(df), tamanho_lote):
+        conn.execute(query, registros(df.iloc[i:i + tamanho_lote]))
+    return len(df)
+
+
+def criar_tabela_temporaria(conn, nome, tabela_origem, colunas):
+    """Cria (ou recria) uma tabela temporária com as colunas e tipos de `tabela_origem`."""
+    conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {nome}"))
+    conn.execute(text(
+        f"CREATE TEMPORARY TABLE {nome} AS SELECT {', '.join(colunas)} FROM {tabela_origem} LIMIT 0"
+    ))
+
+
+def atualizar_colunas_em_massa(engine, tabela, df, chave='id', tamanho_lote=50_000):
+    """Grava as colunas de `df` nas linhas de `tabela` com a mesma `chave`.
+
+    Cada lote vai para uma tabela temporária e é aplicado com um único
+    UPDATE ... JOIN, numa transação por lote. Retorna o total de linhas alteradas.
+    """
+    colunas = [c for c in df.columns if c != chave]
+    if df.empty or not colunas:
+        return 0
+
+    temporaria = f"tmp_{tabela}_atualizacao"
+    atribuicoes = ', '.join(f"t.{c} = s.{c}" for c in colunas)
+    alteradas = 0
+    for i in range(0, len(df), tamanho_lote):
+        with engine.begin() as conn:
+            criar_tabela_temporaria(conn, temporaria, tabela, df.columns)
+            inserir_em_lotes(conn, temporaria, df.iloc[i:i + tamanho_lote])
+            resultado = conn.execute(text(f"""
+                UPDATE {tabela} AS t
+                JOIN {temporaria} AS s ON s.{chave} = t.{chave}
+                SET {atribuicoes}
+            """))
+            alteradas += resultado.rowcount
+            conn.execute(text(f"DROP TEMPORARY TABLE {temporaria}"))
+    return alteradas
@@ -1,9 +1,51 @@
+import threading
+import time
+
 import streamlit as st
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
 import ssl
 
+_engine = None
+_engine_lock = threading.Lock()
 
-def conectar():
+
+class PoolMedido(QueuePool):
+    """QueuePool que mede quanto tempo cada checkout esperou por uma conexão."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._medicao_lock = threading.Lock()
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._medicao_lock:
+                self.checkouts += 1
+                self.espera_total += espera
+                self.espera_maxima = max(self.espera_maxima, espera)
+
+
+def _config(nome, padrao):
+    valor = st.secrets.get(nome, padrao)
+    if isinstance(padrao, bool):
+        # bool("false") seria True: texto é interpretado explicitamente
+        texto = str(valor).strip().lower()
+        if texto in ("1", "true", "yes", "sim"):
+            return True
+        if texto in ("0", "false", "no", "nao", "não"):
+            return False
+        raise ValueError(f"{nome} deve ser verdadeiro ou falso, não {valor!r}")
+    return type(padrao)(valor)
+
+
+def _criar_engine():
     try:
         usuario = st.secrets["DBUSER"]
         senha = st.secrets["DBPASSWORD"]
@@ -14,12 +56,45 @@ def conectar():
         st.error(f"A chave {e} está faltando em st.secrets! Verifique seu secrets.toml ou painel no Streamlit Cloud.")
         st.stop()
 
-    import ssl
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
 
     url = f"mysql+pymysql://{usuario}:{senha}@{host}:{porta}/{banco}"
-    from sqlalchemy import create_engine
-    engine = create_engine(url, connect_args={'ssl': ssl_context})
-    return engine
+    return create_engine(
+        url,
+        connect_args={'ssl': ssl_context},
+        poolclass=PoolMedido,
+        pool_size=_config("DB_POOL_SIZE", 5),
+        max_overflow=_config("DB_MAX_OVERFLOW", 10),
+        pool_timeout=_config("DB_POOL_TIMEOUT", 30),
+        # Descarta conexões derrubadas pelo servidor antes de entregá-las
+        pool_pre_ping=_config("DB_POOL_PRE_PING", True),
+        pool_recycle=_config("DB_POOL_RECYCLE", 1800),
+    )
+
+
+def conectar():
+    """Engine único do processo: todas as páginas e sessões compartilham o mesmo pool."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _criar_engine()
+    return _engine
+
+
+def estatisticas_pool():
+    """Uso atual do pool de conexões e tempo de espera acumulado nos checkouts."""
+    pool = conectar().pool
+    with pool._medicao_lock:
+        checkouts, espera_total, espera_maxima = pool.checkouts, pool.espera_total, pool.espera_maxima
+    return {
+        "tamanho": pool.size(),
+        "em_uso": pool.checkedout(),
+        "ociosas": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": checkouts,
+        "espera_media_ms": 1000 * espera_total / checkouts if checkouts else 0.0,
+        "espera_maxima_ms": 1000 * espera_maxima,
+    }
@@ -0,0 +1,75 @@
+import pandas as pd
+from sqlalchemy import text
+
+from backend.esquema import garantir_indice
+from backend.filtros import contendo, padrao_contendo
+
+COLUNAS_NOTAS = [
+    'id', 'data_registro', 'conta', 'cliente', 'q_negociacao', 'tipo_lado', 'tipo_mercado', 'ativo_base',
+    'quantidade', 'preco', 'valor_operacao', 'debito_credito', 'tipo_papel', 'tipo_opcao',
+]
+
+
+def garantir_indices_notas(engine):
+    # (data_registro, id) atende a ordenação da página, o cursor e o COUNT por período
+    garantir_indice(engine, 'notas', 'ix_notas_data_registro_id', ['data_registro', 'id'])
+
+
+def _filtros(cliente=None, ativo=None, data_inicio=None, data_fim=None, tipo_papel=None):
+    condicoes, params = [], {}
+    if cliente:
+        condicoes.append(contendo("cliente", "cliente"))
+        params["cliente"] = padrao_contendo(cliente)
+    if ativo:
+        condicoes.append(contendo("ativo_base", "ativo"))
+        params["ativo"] = padrao_contendo(ativo)
+    if data_inicio:
+        condicoes.append("data_registro >= :data_inicio")
+        params["data_inicio"] = data_inicio
+    if data_fim:
+        condicoes.append("data_registro <= :data_fim")
+        params["data_fim"] = data_fim
+    if tipo_papel:
+        condicoes.append("tipo_papel = :tipo_papel")
+        params["tipo_papel"] = tipo_papel
+    return condicoes, params
+
+
+def contar_notas(engine, **filtros):
+    garantir_indices_notas(engine)
+    condicoes, params = _filtros(**filtros)
+    where = " AND ".join(condicoes) or "1=1"
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM notas WHERE {where}"), params).scalar()
+
+
+def pagina_notas(engine, cursor=None, tamanho_pagina=100, **filtros):
+    """Próxima página de notas, da mais recente para a mais antiga, a partir de `cursor`.
+
+    `cursor` é o (data_registro, id) da última nota da página anterior (None na
+    primeira). A busca continua pelo índice a partir dele, sem OFFSET, então
+    qualquer página custa o mesmo. Retorna (DataFrame, cursor da próxima página
+    ou None se esta foi a última).
+    """
+    garantir_indices_notas(engine)
+    condicoes, params = _filtros(**filtros)
+    if cursor is not None:
+        condicoes.append("(data_registro < :cursor_data OR (data_registro = :cursor_data AND id < :cursor_id))")
+        params.update({"cursor_data": cursor[0], "cursor_id": cursor[1]})
+    where = " AND ".join(condicoes) or "1=1"
+    # Uma linha a mais só para saber se existe próxima página
+    params["limite"] = tamanho_pagina + 1
+
+    df = pd.read_sql(text(f"""
+        SELECT {', '.join(COLUNAS_NOTAS)}
+        FROM notas
+        WHERE {where}
+        ORDER BY data_registro DESC, id DESC
+        LIMIT :limite
+    """), engine, params=params)
+
+    if len(df) <= tamanho_pagina:
+        return df, None
+    df = df.iloc[:tamanho_pagina]
+    ultima = df.iloc[-1]
+    return df, (ultima['data_registro'], int(ultima['id']))
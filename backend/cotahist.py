@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+TAMANHO_REGISTRO = 245
+
+# Mesmas posições usadas até aqui com pd.read_fwf
+CAMPOS_TEXTO = {
+    'codigo_bdi': (12, 24),
+    'codigo_negociacao': (24, 36),
+    'nome_empresa': (27, 39),
+    'especificacao_papel': (39, 49),
+}
+CAMPOS_PRECO = {
+    'preco_abertura': (56, 69),
+    'preco_maximo': (69, 82),
+    'preco_minimo': (82, 95),
+    'preco_medio': (95, 108),
+    'preco_fechamento': (108, 121),
+    'volume': (152, 170),
+}
+COLUNAS = ['data_pregao', *CAMPOS_TEXTO, *CAMPOS_PRECO]
+
+
+def _inteiros(registros, inicio, fim):
+    digitos = registros[:, inicio:fim].astype(np.int64) - ord('0')
+    digitos[(digitos < 0) | (digitos > 9)] = 0  # espaços/brancos contam como zero
+    pesos = 10 ** np.arange(fim - inicio - 1, -1, -1, dtype=np.int64)
+    return digitos @ pesos
+
+
+def _textos(registros, inicio, fim):
+    brutos = np.ascontiguousarray(registros[:, inicio:fim]).view(f'S{fim - inicio}').ravel()
+    # Códigos e nomes se repetem muito: decodifica só os valores distintos
+    unicos, posicoes = np.unique(brutos, return_inverse=True)
+    textos = np.array([u.decode('latin1').strip() or None for u in unicos], dtype=object)
+    return textos[posicoes.ravel()]
+
+
+def _converter(registros):
+    registros = registros[(registros[:, 0] == ord('0')) & (registros[:, 1] == ord('1'))]
+
+    data = _inteiros(registros, 2, 10)
+    df = pd.DataFrame({
+        'data_pregao': pd.to_datetime(
+            pd.DataFrame({'year': data // 10000, 'month': data // 100 % 100, 'day': data % 100})
+        )
+    })
+    for nome, (inicio, fim) in CAMPOS_TEXTO.items():
+        df[nome] = _textos(registros, inicio, fim)
+    for nome, (inicio, fim) in CAMPOS_PRECO.items():
+        df[nome] = _inteiros(registros, inicio, fim) / 100
+    return df
+
+
+def ler_cotahist_em_lotes(arquivo, registros_por_lote=100_000):
+    """Lê um arquivo COTAHIST da B3 em blocos e devolve DataFrames tipados, um por lote.
+
+    Só os registros de cotação (tipo '01') são devolvidos. Os campos são fatiados
+    direto dos bytes com NumPy, sem decodificar o arquivo inteiro nem montar
+    linhas em Python, então a memória fica limitada ao tamanho do lote.
+    """
+    inicio = arquivo.read(TAMANHO_REGISTRO + 2)
+    if not inicio:
+        return
+    quebra = inicio[TAMANHO_REGISTRO:TAMANHO_REGISTRO + 2]
+    tamanho = TAMANHO_REGISTRO + (2 if quebra == b'\r\n' else 1 if quebra[:1] == b'\n' else 0)
+
+    resto = inicio
+    while True:
+        bloco = arquivo.read(tamanho * registros_por_lote - len(resto))
+        dados = resto + bloco
+        if not dados:
+            break
+
+        completos = len(dados) // tamanho * tamanho
+        if not bloco and completos < len(dados):
+            # último registro sem quebra de linha no final do arquivo
+            dados = dados.ljust(completos + tamanho, b' ')
+            completos = len(dados)
+        resto = dados[completos:]
+
+        if completos:
+            registros = np.frombuffer(dados, dtype=np.uint8, count=completos).reshape(-1, tamanho)
+            df = _converter(registros)
+            if not df.empty:
+                yield df
+        if not bloco:
+            break
@@ -0,0 +1,73 @@
+from sqlalchemy import text
+
+# Índices já conferidos neste processo, para não consultar o information_schema a cada importação
+_verificados = {}
+
+
+def _indice_existe(conn, tabela, nome):
+    return conn.execute(text("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabela AND INDEX_NAME = :nome
+    """), {"tabela": tabela, "nome": nome}).scalar() > 0
+
+
+def garantir_indice(engine, tabela, nome, colunas, unico=False):
+    """Cria o índice `nome` em `tabela` se ainda não existir. Retorna False se não for possível criá-lo."""
+    chave = (tabela, nome)
+    if chave in _verificados:
+        return _verificados[chave]
+
+    tipo = "UNIQUE KEY" if unico else "INDEX"
+    with engine.connect() as conn:
+        if _indice_existe(conn, tabela, nome):
+            _verificados[chave] = True
+            return True
+        try:
+            conn.execute(text(f"ALTER TABLE {tabela} ADD {tipo} {nome} ({', '.join(colunas)})"))
+            conn.commit()
+            _verificados[chave] = True
+        except Exception as e:
+            print(f"Não foi possível criar o índice {nome} em {tabela}: {e}")
+            _verificados[chave] = False
+    return _verificados[chave]
+
+
+def garantir_tabela(engine, nome, ddl):
+    """Executa o `ddl` (CREATE TABLE IF NOT EXISTS ...) uma vez por processo."""
+    chave = (nome, None)
+    if chave not in _verificados:
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+        _verificados[chave] = True
+
+
+def _coluna_existe(conn, tabela, nome):
+    return conn.execute(text("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabela AND COLUMN_NAME = :nome
+    """), {"tabela": tabela, "nome": nome}).scalar() > 0
+
+
+def coluna_existe(engine, tabela, nome):
+    with engine.connect() as conn:
+        return _coluna_existe(conn, tabela, nome)
+
+
+def garantir_coluna(engine, tabela, nome, definicao):
+    """Acrescenta a coluna `nome` a `tabela` se ainda não existir. Retorna False se não for possível."""
+    chave = (tabela, 'coluna:' + nome)
+    if chave in _verificados:
+        return _verificados[chave]
+
+    with engine.connect() as conn:
+        if _coluna_existe(conn, tabela, nome):
+            _verificados[chave] = True
+            return True
+        try:
+            conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {nome} {definicao}"))
+            conn.commit()
+            _verificados[chave] = True
+        except Exception as e:
+            print(f"Não foi possível criar a coluna {nome} em {tabela}: {e}")
+            _verificados[chave] = False
+    return _verificados[chave]
@@ -0,0 +1,12 @@
+# Filtros de busca por trecho usados nas consultas das páginas
+
+
+def contendo(coluna, parametro):
+    """Condição `coluna LIKE :parametro` com '!' como caractere de escape (ver `padrao_contendo`)."""
+    return f"{coluna} LIKE :{parametro} ESCAPE '!'"
+
+
+def padrao_contendo(texto):
+    """Padrão LIKE que casa `texto` em qualquer posição; % e _ digitados pelo usuário são literais."""
+    escapado = texto.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return f"%{escapado}%"
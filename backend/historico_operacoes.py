@@ -0,0 +1,327 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from backend.analitico import agregar_operacoes, calcular_metricas
+from backend.carga_em_massa import criar_tabela_temporaria, inserir_em_lotes
+from backend.esquema import garantir_indice, garantir_tabela
+from backend.proventos import CHAVES, calcular_proventos
+
+# Posições (conta, cliente, ativo_base) a recalcular na próxima atualização incremental.
+# Linhas com conta/cliente nulos valem para todas as posições do ativo (proventos, preços).
+DDL_PENDENTES = """
+    CREATE TABLE IF NOT EXISTS historico_operacoes_pendentes (
+        id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        conta BIGINT NULL,
+        cliente VARCHAR(255) NULL,
+        ativo_base VARCHAR(20) NOT NULL,
+        registrado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+# ------------------------------
+# Registro de posições afetadas
+# ------------------------------
+# Valores por comando nas listas passadas em IN
+ITENS_POR_LOTE = 5000
+
+
+def _ler_em_lotes(engine, sql, valores):
+    """Resultado de `sql` (com `IN :valores`) para todos os `valores` (não vazio), um SELECT por lote."""
+    query = text(sql).bindparams(bindparam("valores", expanding=True))
+    partes = [pd.read_sql(query, engine, params={"valores": lote}) for lote in particionar(valores, ITENS_POR_LOTE)]
+    return pd.concat(partes, ignore_index=True)
+
+
+def _ativos_iniciados_em(engine, datas, coluna_ativo, coluna_data):
+    """Ativos de `datas` cuja data coincide com a primeira nota do ativo (MIN(data_registro)).
+
+    É dessa data que sai preco_fechamento_inicio_operacoes de todas as posições do ativo.
+    """
+    datas = datas[[coluna_ativo, coluna_data]].dropna()
+    if datas.empty:
+        return []
+    inicio = _ler_em_lotes(engine, """
+        SELECT ativo_base, MIN(data_registro) AS data_inicio FROM notas
+        WHERE ativo_base IN :valores GROUP BY ativo_base
+    """, sorted(datas[coluna_ativo].astype(str).unique()))
+    inicio['data_inicio'] = pd.to_datetime(inicio['data_inicio']).dt.normalize()
+    datas = datas.assign(**{coluna_data: pd.to_datetime(datas[coluna_data]).dt.normalize()})
+    afetados = datas.merge(inicio, left_on=[coluna_ativo, coluna_data], right_on=['ativo_base', 'data_inicio'])
+    return afetados['ativo_base'].unique().tolist()
+
+
+def registrar_pendencias_notas(engine, id_minimo, ids=()):
+    """Marca para recálculo as posições das notas com id >= id_minimo ou com os `ids` dados.
+
+    `ids` traz as notas antigas que o enriquecimento só classificou agora. Se uma
+    das notas é a primeira do seu ativo (nota retroativa, ou ativo novo), o preço
+    de início muda para todas as posições do ativo, e o ativo inteiro é marcado.
+    """
+    garantir_tabela(engine, 'historico_operacoes_pendentes', DDL_PENDENTES)
+    colunas = "conta, cliente, ativo_base, data_registro"
+    partes = [pd.read_sql(
+        text(f"SELECT {colunas} FROM notas WHERE id >= :id_minimo AND ativo_base IS NOT NULL"),
+        engine, params={"id_minimo": id_minimo}
+    )]
+    antigas = sorted({int(i) for i in ids if i < id_minimo})
+    if antigas:
+        partes.append(_ler_em_lotes(
+            engine, f"SELECT {colunas} FROM notas WHERE id IN :valores AND ativo_base IS NOT NULL", antigas
+        ))
+    notas = pd.concat(partes, ignore_index=True)
+    if notas.empty:
+        return
+
+    with engine.begin() as conn:
+        inserir_em_lotes(conn, 'historico_operacoes_pendentes', notas[CHAVES].drop_duplicates())
+    registrar_pendencias_ativos(engine, _ativos_iniciados_em(engine, notas, 'ativo_base', 'data_registro'))
+
+
+def registrar_pendencias_ativos(engine, ativos):
+    """Marca todas as posições dos `ativos` para recálculo."""
+    ativos = sorted({str(a) for a in ativos if pd.notna(a)})
+    if not ativos:
+        return
+    garantir_tabela(engine, 'historico_operacoes_pendentes', DDL_PENDENTES)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO historico_operacoes_pendentes (ativo_base) VALUES (:ativo)"),
+            [{"ativo": a} for a in ativos]
+        )
+
+
+def registrar_pendencias_precos(engine, precos):
+    """Marca os ativos cujo fechamento no dia da primeira nota está em `precos` (um lote do histórico)."""
+    registrar_pendencias_ativos(engine, _ativos_iniciados_em(engine, precos, 'codigo_bdi', 'data_pregao'))
+
+
+# ------------------------------
+# Leitura
+# ------------------------------
+# Só as colunas usadas no cálculo das posições
+COLUNAS_NOTAS = ['conta', 'cliente', 'ativo_base', 'tipo_papel', 'tipo_lado', 'quantidade', 'valor_operacao', 'data_registro']
+COLUNAS_PROVENTOS = ['ativo', 'data_com', 'valor']
+
+ATIVOS_POR_PARTICAO = int(os.getenv("HISTORICO_ATIVOS_POR_PARTICAO", 200))
+PROCESSOS = int(os.getenv("HISTORICO_PROCESSOS", 1))
+
+
+def garantir_indices_historico(engine):
+    # Cada partição filtra notas e proventos pelos seus ativos; sem índice, N partições = N varreduras.
+    # data_registro no índice de notas também atende o MIN(data_registro) por ativo do preço de início.
+    garantir_indice(engine, 'notas', 'ix_notas_ativo_base_data', ['ativo_base', 'data_registro'])
+    garantir_indice(engine, 'proventos', 'ix_proventos_ativo', ['ativo'])
+
+
+def listar_ativos(engine):
+    return pd.read_sql(
+        "SELECT DISTINCT ativo_base FROM notas WHERE ativo_base IS NOT NULL ORDER BY ativo_base", engine
+    )['ativo_base'].tolist()
+
+
+def particionar(ativos, tamanho=ATIVOS_POR_PARTICAO):
+    """Divide a lista de ativos em partições de até `tamanho` ativos."""
+    ativos = list(ativos)
+    return [ativos[i:i + tamanho] for i in range(0, len(ativos), tamanho)]
+
+
+def _carregar_dados(engine, ativos):
+    """Notas, proventos, preços atuais e preço de início das operações dos `ativos`."""
+    def consulta(sql, coluna, agrupar=""):
+        query = text(f"{sql} WHERE {coluna} IN :ativos {agrupar}").bindparams(bindparam("ativos", expanding=True))
+        return pd.read_sql(query, engine, params={"ativos": list(ativos)})
+
+    notas = consulta(f"SELECT {', '.join(COLUNAS_NOTAS)} FROM notas", "ativo_base")
+    prov = consulta(f"SELECT {', '.join(COLUNAS_PROVENTOS)} FROM proventos", "ativo")
+    ativos_yahoo = consulta("SELECT DISTINCT asset_original, preco_atual FROM ativos_yahoo", "asset_original")
+
+    # Fechamento no dia da primeira nota de cada ativo, sem trazer o historico_precos inteiro
+    preco_inicio = consulta("""
+        SELECT m.ativo_base, h.preco_fechamento AS preco_fechamento_inicio_operacoes
+        FROM (SELECT ativo_base, MIN(data_registro) AS data_inicio FROM notas
+              WHERE ativo_base IN :ativos GROUP BY ativo_base) m
+        LEFT JOIN historico_precos h ON h.codigo_bdi = m.ativo_base AND h.data_pregao = m.data_inicio
+    """, "m.ativo_base")
+    preco_inicio = preco_inicio.drop_duplicates(subset=['ativo_base'])
+
+    notas['data_registro'] = pd.to_datetime(notas['data_registro'], errors='coerce')
+    prov['data_com'] = pd.to_datetime(prov['data_com'], errors='coerce')
+    return notas, prov, ativos_yahoo, preco_inicio
+
+
+# ------------------------------
+# Cálculo
+# ------------------------------
+def consolidar_posicoes(notas, prov, ativos_yahoo, preco_inicio):
+    """Consolida as notas por (conta, cliente, ativo_base) no formato de historico_operacoes."""
+    consolidado = agregar_operacoes(notas)
+
+    acoes = notas[notas['tipo_papel'] == 'ACAO']
+    consolidado['Proventos'] = calcular_proventos(consolidado, acoes, prov)
+
+    # Preço atual (ativos_yahoo) e fechamento no início das operações
+    consolidado = pd.merge(
+        consolidado,
+        ativos_yahoo[['asset_original', 'preco_atual']],
+        left_on='ativo_base',
+        right_on='asset_original',
+        how='left'
+    )
+    consolidado['preco_fechamento'] = consolidado['preco_atual'].fillna(0)
+    consolidado.drop(columns=['asset_original', 'preco_atual'], inplace=True)
+    consolidado = pd.merge(consolidado, preco_inicio, on='ativo_base', how='left')
+
+    consolidado = calcular_metricas(consolidado)
+    return consolidado.drop_duplicates(subset=CHAVES)
+
+
+# ------------------------------
+# Gravação
+# ------------------------------
+def _ler_pendencias(engine):
+    garantir_tabela(engine, 'historico_operacoes_pendentes', DDL_PENDENTES)
+    return pd.read_sql("SELECT id, conta, cliente, ativo_base FROM historico_operacoes_pendentes", engine)
+
+
+def _filtrar_chaves(consolidado, ativos_inteiros, chaves):
+    """Mantém só as posições dos ativos inteiros ou das chaves pendentes."""
+    alvo = consolidado['ativo_base'].isin(ativos_inteiros).to_numpy()
+    if not chaves.empty:
+        chaves = chaves.astype({'conta': consolidado['conta'].dtype}, errors='ignore')
+        marcadas = consolidado[CHAVES].merge(chaves, on=CHAVES, how='left', indicator=True)['_merge'] == 'both'
+        alvo |= marcadas.to_numpy()
+    return consolidado[alvo]
+
+
+def _remover_posicoes(conn, ativos_inteiros, chaves):
+    if ativos_inteiros:
+        conn.execute(
+            text("DELETE FROM historico_operacoes WHERE ativo_base IN :ativos").bindparams(
+                bindparam("ativos", expanding=True)),
+            {"ativos": sorted(ativos_inteiros)}
+        )
+    if not chaves.empty:
+        criar_tabela_temporaria(conn, 'tmp_historico_chaves', 'historico_operacoes', CHAVES)
+        inserir_em_lotes(conn, 'tmp_historico_chaves', chaves)
+        conn.execute(text("""
+            DELETE h FROM historico_operacoes h
+            JOIN tmp_historico_chaves t
+              ON t.conta <=> h.conta AND t.cliente <=> h.cliente AND t.ativo_base = h.ativo_base
+        """))
+        conn.execute(text("DROP TEMPORARY TABLE tmp_historico_chaves"))
+
+
+def _consolidar_particao(carregar, particao):
+    return consolidar_posicoes(*carregar(particao))
+
+
+def _carregar_no_processo(particao):
+    # Roda dentro do processo do pool: cada processo abre o seu próprio engine
+    from backend.conexao import conectar
+    return _carregar_dados(conectar(), particao)
+
+
+def consolidar_particoes(carregar, particoes, processos=PROCESSOS):
+    """Carrega e consolida cada partição e devolve os resultados à medida que ficam prontos.
+
+    `carregar(particao)` lê os dados da partição. Com `processos` > 1 a leitura e
+    o cálculo rodam num pool de processos: cada processo recebe só a lista de
+    ativos da partição (`carregar` precisa ser uma função de módulo, para ir ao
+    processo por referência) e devolve só o consolidado. No máximo 2 * `processos`
+    partições ficam em andamento ao mesmo tempo. A ordem dos resultados não é garantida.
+    """
+    if processos <= 1:
+        for particao in particoes:
+            yield _consolidar_particao(carregar, particao)
+        return
+
+    # spawn: o Streamlit mantém threads vivas, e fork com threads pode travar o filho
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+        em_andamento = set()
+        for particao in particoes:
+            em_andamento.add(pool.submit(_consolidar_particao, carregar, particao))
+            if len(em_andamento) >= 2 * processos:
+                prontos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    yield futuro.result()
+        for futuro in wait(em_andamento).done:
+            yield futuro.result()
+
+
+def _calcular(engine, ativos, ativos_por_particao, processos):
+    # Proventos, preço de início e preço atual dependem só do ativo:
+    # cada partição lê apenas as notas dos seus ativos
+    carregar = _carregar_no_processo if processos > 1 else partial(_carregar_dados, engine)
+    return consolidar_particoes(carregar, particionar(ativos, ativos_por_particao), processos)
+
+
+def _reconstruir_completo(engine, ativos_por_particao, processos):
+    """Recalcula tudo numa tabela sombra e publica com RENAME TABLE atômico."""
+    total = 0
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS historico_operacoes_novo"))
+        conn.execute(text("CREATE TABLE historico_operacoes_novo LIKE historico_operacoes"))
+
+    with engine.begin() as conn:
+        for consolidado in _calcular(engine, listar_ativos(engine), ativos_por_particao, processos):
+            total += inserir_em_lotes(conn, 'historico_operacoes_novo', consolidado)
+
+    # Quem consulta historico_operacoes vê a tabela antiga inteira até a troca, e a nova inteira depois
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS historico_operacoes_antigo"))
+        conn.execute(text("""
+            RENAME TABLE historico_operacoes TO historico_operacoes_antigo,
+                         historico_operacoes_novo TO historico_operacoes
+        """))
+        conn.execute(text("DROP TABLE historico_operacoes_antigo"))
+    return total
+
+
+def reconstruir_historico(engine, completo=False, ativos_por_particao=ATIVOS_POR_PARTICAO, processos=PROCESSOS):
+    """Atualiza historico_operacoes e retorna o número de posições gravadas.
+
+    No modo incremental só as posições registradas em historico_operacoes_pendentes
+    são recalculadas (removidas e regravadas numa transação); `completo=True`
+    recalcula tudo numa tabela sombra, trocada pela atual ao final.
+    Os ativos são processados em partições de `ativos_por_particao`: cada partição
+    é lida, calculada e gravada antes da próxima, o que limita o pico de memória.
+    Com `processos` > 1 cada partição é lida e calculada em paralelo, num
+    processo com o seu próprio engine (conectar()); a gravação continua neste processo.
+    """
+    # Mais processos que núcleos só soma o custo de subir e alimentar o pool
+    processos = max(1, min(processos, os.cpu_count() or 1))
+    garantir_indices_historico(engine)
+    pendentes = _ler_pendencias(engine)
+    ultimo_pendente = int(pendentes['id'].max()) if not pendentes.empty else 0
+
+    if completo:
+        total = _reconstruir_completo(engine, ativos_por_particao, processos)
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM historico_operacoes_pendentes WHERE id <= :id"), {"id": ultimo_pendente})
+        return total
+
+    if pendentes.empty:
+        return 0
+
+    # Pendências sem conta/cliente valem para o ativo inteiro (proventos e preços)
+    por_ativo = pendentes['conta'].isna() & pendentes['cliente'].isna()
+    ativos_inteiros = set(pendentes.loc[por_ativo, 'ativo_base'])
+    chaves = pendentes.loc[~por_ativo & ~pendentes['ativo_base'].isin(ativos_inteiros), CHAVES].drop_duplicates()
+    ativos = sorted(ativos_inteiros | set(chaves['ativo_base']))
+
+    total = 0
+    # Tudo numa transação: quem lê historico_operacoes não vê o recálculo pela metade
+    with engine.begin() as conn:
+        _remover_posicoes(conn, ativos_inteiros, chaves)
+        for consolidado in _calcular(engine, ativos, ativos_por_particao, processos):
+            consolidado = _filtrar_chaves(consolidado, ativos_inteiros, chaves)
+            total += inserir_em_lotes(conn, 'historico_operacoes', consolidado)
+        conn.execute(text("DELETE FROM historico_operacoes_pendentes WHERE id <= :id"), {"id": ultimo_pendente})
+    return total
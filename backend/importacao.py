@@ -1,24 +1,42 @@
 import pandas as pd
-import numpy as np
 import re
 import sys
 import os
-import yfinance as yf
 from datetime import datetime
 from datetime import date
-from sqlalchemy import text
-from io import StringIO
-import bcrypt
+from sqlalchemy import bindparam, text
 import streamlit as st
 
 
 # Adiciona a pasta raiz (Estruturadas) ao path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from backend.conexao import conectar
+from backend.cotahist import ler_cotahist_em_lotes
+from backend.carga_em_massa import atualizar_colunas_em_massa, criar_tabela_temporaria, inserir_em_lotes
+from backend.esquema import garantir_indice
+from backend.vencimentos import letra_da_opcao, resolver_vencimentos
+from backend.consulta_notas import garantir_indices_notas
+from backend.premio_mensal import garantir_premio_mensal, recalcular_premio_mensal, somar_premios
+from backend.opcoes import classificar_resultado, gravar_resultados
+from backend.ultimo_preco import atualizar_ultimo_preco, garantir_ultimo_preco
+from backend.ativos_livres import atualizar_derivados, garantir_chaves_normalizadas, recalcular_derivados
+from backend.filtros import contendo, padrao_contendo
+from backend.cache_consultas import incrementar_versao, registrar_derivacao, versoes
+from backend.historico_operacoes import (
+    reconstruir_historico, registrar_pendencias_ativos, registrar_pendencias_notas, registrar_pendencias_precos,
+)
+
+
+def __getattr__(nome):
+    # Compatibilidade com `from backend.importacao import engine`: o engine só é
+    # criado quando alguém o usa, não na importação do módulo
+    if nome == "engine":
+        return conectar()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
-engine = conectar()  # cria a conexão uma vez
 
 def importar_ativos_yahoo(caminho_arquivo: str, tipo_arquivo: str = 'csv') -> str:
+    engine = conectar()
     try:
         if not os.path.exists(caminho_arquivo):
             return f"Arquivo não encontrado em: {caminho_arquivo}"
@@ -43,6 +61,7 @@ def importar_ativos_yahoo(caminho_arquivo: str, tipo_arquivo: str = 'csv') -> st
                     "original": str(row['asset_original']).strip(),
                     "yahoo": str(row['asset_yahoo']).strip()
                 })
+        incrementar_versao(engine, 'ativos_yahoo')
 
         return "✅ Ativos importados com sucesso."
     except Exception as e:
@@ -57,6 +76,8 @@ def obter_lista_assets(engine):
 
 def obter_preco_ultimo(asset):
     try:
+        import yfinance as yf
+
         ticker_formatado = asset.strip().upper()
         ativo = yf.Ticker(ticker_formatado)
         historico = ativo.history(period="1d")
@@ -82,11 +103,48 @@ def atualizar_preco(engine, ticker, preco):
     try:
         with engine.begin() as conn:
             conn.execute(query, {"preco": preco, "data": hoje, "ticker": ticker})
+        incrementar_versao(engine, 'ativos_yahoo')
     except Exception as e:
         print(f"Erro ao atualizar {ticker}: {e}")
 
 
+def atualizar_precos(engine, precos):
+    """Grava um lote {asset_original: preco} em ativos_yahoo numa única transação.
+
+    Retorna o número de linhas alteradas.
+    """
+    df = pd.DataFrame(
+        [(ticker, float(preco)) for ticker, preco in precos.items() if preco is not None],
+        columns=['asset_original', 'preco_atual']
+    )
+    df['data_atualizacao'] = datetime.now()
+    antes = _precos_gravados(engine, df['asset_original'])
+    linhas = atualizar_colunas_em_massa(engine, 'ativos_yahoo', df, chave='asset_original')
+    # Comparado com o valor gravado (já arredondado pela coluna), não com o recebido do provedor
+    depois = _precos_gravados(engine, df['asset_original'])
+    alterados = [asset for asset, preco in depois.items() if antes.get(asset) != preco]
+    if alterados:
+        # Preço novo muda posição e rentabilidade de todas as posições do ativo;
+        # revalidação que traz o mesmo preço não gera recálculo nem invalida caches
+        registrar_pendencias_ativos(engine, alterados)
+        incrementar_versao(engine, 'ativos_yahoo')
+    return linhas
+
+
+def _precos_gravados(engine, assets):
+    """{asset_original: preco_atual} de ativos_yahoo para os `assets`."""
+    assets = list(assets)
+    if not assets:
+        return {}
+    query = text("SELECT asset_original, preco_atual FROM ativos_yahoo WHERE asset_original IN :assets").bindparams(
+        bindparam("assets", expanding=True)
+    )
+    with engine.connect() as conn:
+        return dict(conn.execute(query, {"assets": assets}).fetchall())
+
+
 def importar_clientes():
+    engine = conectar()
     arquivo = st.file_uploader("📥 Importar clientes (.xlsx)", type=["xlsx"])
     if arquivo:
         try:
@@ -95,11 +153,13 @@ def importar_clientes():
             df['data_entrada'] = pd.to_datetime(df['data_entrada'], errors='coerce').dt.date
 
             df.to_sql('clientes', con=engine, if_exists='append', index=False)
+            incrementar_versao(engine, 'clientes')
             st.success("✅ Clientes importados com sucesso.")
         except Exception as e:
             st.error(f"❌ Erro ao importar clientes: {e}")
 
 def importar_vencimentos_opcoes():
+    engine = conectar()
     arquivo = st.file_uploader("📥 Importar vencimentos de opções (.xlsx)", type=["xlsx"])
     if arquivo:
         try:
@@ -107,51 +167,86 @@ def importar_vencimentos_opcoes():
             df['data_vencimento'] = pd.to_datetime(df['data_vencimento'], dayfirst=True, errors='coerce').dt.date
 
             df.to_sql('vencimentos_opcoes', con=engine, if_exists='append', index=False)
+            incrementar_versao(engine, 'vencimentos_opcoes')
             st.success("✅ Vencimentos de opções importados com sucesso.")
         except Exception as e:
             st.error(f"❌ Erro ao importar vencimentos: {e}")
 
 def importar_historico_precos():
+    engine = conectar()
     arquivo = st.file_uploader("📥 Importar histórico de preços B3 (.txt)", type=["txt"])
     if arquivo:
         try:
-            colspecs = [
-                (2, 10), (12, 24), (24, 36), (27, 39), (39, 49),
-                (56, 69), (69, 82), (82, 95), (95, 108), (108, 121), (152, 170)
-            ]
-            colnames = [
-                'data_pregao', 'codigo_bdi', 'codigo_negociacao', 'nome_empresa',
-                'especificacao_papel', 'preco_abertura', 'preco_maximo',
-                'preco_minimo', 'preco_medio', 'preco_fechamento', 'volume'
-            ]
-
-            linhas = arquivo.getvalue().decode('latin1').splitlines()
-            linhas_validas = [linha for linha in linhas if linha.startswith('01')]
-
-            df = pd.read_fwf(StringIO('\n'.join(linhas_validas)), colspecs=colspecs, names=colnames)
-            df['data_pregao'] = pd.to_datetime(df['data_pregao'], format='%Y%m%d')
-            for col in colnames[5:10]:
-                df[col] = df[col].astype(float) / 100
-            df['volume'] = df['volume'].astype(float) / 100
-
             nome_tabela = 'historico_precos'
-            df_existente = pd.read_sql(f"SELECT data_pregao, codigo_bdi FROM {nome_tabela}", engine)
-            df_existente['data_pregao'] = pd.to_datetime(df_existente['data_pregao'])
-
-            df_novo = df.merge(df_existente, on=['data_pregao', 'codigo_bdi'], how='left', indicator=True)
-            df_novo = df_novo[df_novo['_merge'] == 'left_only'].drop(columns=['_merge'])
-
-            if not df_novo.empty:
-                df_novo.to_sql(nome_tabela, con=engine, if_exists='append', index=False)
-                st.success(f"✅ {len(df_novo)} registros novos importados para '{nome_tabela}'.")
+            # Com a chave única, a deduplicação é feita no próprio banco
+            chave_unica = garantir_indice(
+                engine, nome_tabela, 'uk_historico_precos_pregao_bdi', ['data_pregao', 'codigo_bdi'], unico=True
+            )
+
+            garantir_ultimo_preco(engine)
+
+            # O arquivo é lido em lotes para não carregar o COTAHIST inteiro na memória
+            total_novos = 0
+            arquivo.seek(0)
+            for df in ler_cotahist_em_lotes(arquivo):
+                if chave_unica:
+                    total_novos += _inserir_historico_precos_staging(df)
+                else:
+                    total_novos += _inserir_historico_precos_por_periodo(df)
+
+            if total_novos:
+                incrementar_versao(engine, 'historico_precos', 'ultimo_preco')
+                st.success(f"✅ {total_novos} registros novos importados para '{nome_tabela}'.")
             else:
                 st.info("ℹ️ Nenhum registro novo para importar.")
         except Exception as e:
             st.error(f"❌ Erro ao importar histórico de preços: {e}")
 
 
+def _inserir_historico_precos_staging(df):
+    # Carrega o lote numa tabela temporária e insere só as chaves (data_pregao, codigo_bdi) ausentes
+    engine = conectar()
+    with engine.begin() as conn:
+        criar_tabela_temporaria(conn, 'stg_historico_precos', 'historico_precos', df.columns)
+        inserir_em_lotes(conn, 'stg_historico_precos', df)
+        colunas = ', '.join(df.columns)
+        resultado = conn.execute(text(f"""
+            INSERT IGNORE INTO historico_precos ({colunas})
+            SELECT {colunas} FROM stg_historico_precos
+        """))
+        conn.execute(text("DROP TEMPORARY TABLE stg_historico_precos"))
+        atualizar_ultimo_preco(conn, df)
+    # Fechamento no dia da primeira nota de um ativo muda o preço de início das posições dele
+    registrar_pendencias_precos(engine, df)
+    return resultado.rowcount
+
+
+def _inserir_historico_precos_por_periodo(df):
+    # Sem chave única: compara só com os registros do período coberto pelo lote
+    engine = conectar()
+    df_existente = pd.read_sql(
+        text("""
+            SELECT data_pregao, codigo_bdi FROM historico_precos
+            WHERE data_pregao BETWEEN :inicio AND :fim
+        """),
+        engine,
+        params={"inicio": df['data_pregao'].min(), "fim": df['data_pregao'].max()}
+    )
+    df_existente['data_pregao'] = pd.to_datetime(df_existente['data_pregao'])
+
+    df_novo = df.merge(df_existente, on=['data_pregao', 'codigo_bdi'], how='left', indicator=True)
+    df_novo = df_novo[df_novo['_merge'] == 'left_only'].drop(columns=['_merge'])
+
+    with engine.begin() as conn:
+        inseridos = inserir_em_lotes(conn, 'historico_precos', df_novo)
+        atualizar_ultimo_preco(conn, df)
+    registrar_pendencias_precos(engine, df_novo)
+    return inseridos
+
+
 
 def importar_ativos():
+    engine = conectar()
     arquivo = st.file_uploader("📥 Importar ativos (.xlsx)", type=["xlsx"])
     if arquivo:
         try:
@@ -160,11 +255,13 @@ def importar_ativos():
             df['Vencimento'] = pd.to_datetime(df['Vencimento'], errors='coerce', format='%d/%m/%Y').dt.date
 
             df.to_sql('ativos', con=engine, if_exists='append', index=False)
+            incrementar_versao(engine, 'ativos')
             st.success("✅ Ativos importados com sucesso.")
         except Exception as e:
             st.error(f"❌ Erro ao importar ativos: {e}")
 
 def importar_notas_atualizado(caminho_arquivo, tipo):
+    engine = conectar()
     try:
         if tipo == 'csv':
             df = pd.read_csv(caminho_arquivo, decimal=',')
@@ -173,109 +270,128 @@ def importar_notas_atualizado(caminho_arquivo, tipo):
 
         df['data_registro'] = pd.to_datetime(df['data_registro'], dayfirst=True).dt.date
         tabela_destino = 'notas'
+        with engine.connect() as conn:
+            ultimo_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM notas")).scalar()
+        # Migração do resumo de prêmios (só faz algo na primeira vez)
+        garantir_premio_mensal(engine)
         df.to_sql(tabela_destino, con=engine, if_exists='append', index=False)
 
-        query = text("""
-            SELECT id, tipo_mercado, especificacao, on_pn_strike, ativo_base, vencimento 
-            FROM notas 
-            WHERE tipo_mercado LIKE 'OPCAO%' 
-               OR tipo_mercado IN ('EXERC OPC VENDA', 'EXERC OPC COMPRA', 'A VISTA', 'VISTA','FRACIONARIO')
-        """)
-        df_notas = pd.read_sql(query, engine)
-
-        def definir_tipo_papel(tipo_mercado):
-            tipo = tipo_mercado.upper().strip()
-            if tipo in ['OPCAO DE VENDA', 'OPCAO DE COMPRA']:
-                return 'OPCAO'
-            elif tipo in ['EXERC OPC VENDA', 'EXERC OPC COMPRA', 'A VISTA','VISTA','FRACIONARIO']:
-                return 'ACAO'
-            else:
-                return 'ACAO'
-
-        df_notas['tipo_papel'] = df_notas['tipo_mercado'].apply(definir_tipo_papel)
-        df_notas['tipo_opcao'] = df_notas['tipo_mercado'].apply(
-            lambda x: 'CALL' if 'COMPRA' in x.upper() else ('PUT' if 'VENDA' in x.upper() else None)
-        )
-
-        def extrair_strike(valor):
-            try:
-                if not isinstance(valor, str):
-                    return None
-                valor_limpo = valor.strip().replace(',', '.')
-                match = re.search(r'(\d+\.\d+)', valor_limpo)
-                return float(match.group(1)) if match else None
-            except:
-                return None
+        # Enriquecimento só das notas desta carga (e das que ainda estão sem os campos derivados)
+        classificadas = enriquecer_notas(id_minimo=ultimo_id + 1)
+        registrar_pendencias_notas(engine, ultimo_id + 1, classificadas)
+        # tipo_papel só existe depois do enriquecimento; soma as notas de opções ainda não somadas,
+        # inclusive as de uma importação anterior que falhou antes deste passo
+        with engine.begin() as conn:
+            somar_premios(conn)
+        incrementar_versao(engine, 'notas')
+
+        return "✅ Notas importadas e atualizadas com sucesso!"
+    except Exception as e:
+        return f"❌ Erro ao importar ou atualizar notas: {e}"
 
-        df_notas['strike'] = df_notas['especificacao'].apply(extrair_strike)
-        df_notas['on_pn_strike'] = None
-        df_notas = df_notas.where(pd.notnull(df_notas), None)
-        df_notas['strike'] = df_notas['strike'].apply(lambda x: None if pd.isna(x) else x)
-        df_notas['letra_call_put'] = df_notas['especificacao'].str[4]
 
-        df_vencimentos = pd.read_sql("SELECT codigo_letra, data_vencimento FROM vencimentos_opcoes", engine)
-        df_datas_registro = pd.read_sql("SELECT id, data_registro FROM notas", engine)
-        df_notas = df_notas.merge(df_datas_registro, on='id', how='left')
+def enriquecer_notas(id_minimo=None, completo=False):
+    """Calcula tipo_papel, tipo_opcao, strike, letra_call_put e vencimento das notas.
 
-        def encontrar_vencimento(letra, data_registro):
-            datas_possiveis = df_vencimentos[
-                (df_vencimentos['codigo_letra'] == letra) &
-                (df_vencimentos['data_vencimento'] > data_registro)
-            ].sort_values('data_vencimento')
-            return datas_possiveis.iloc[0]['data_vencimento'] if not datas_possiveis.empty else None
+    Por padrão processa só as notas com id >= id_minimo e as que ainda estão com
+    os campos derivados vazios; com completo=True reprocessa todas (backfill).
+    Retorna os ids das notas classificadas pela primeira vez (tipo_papel antes
+    vazio, ou id >= id_minimo).
+    """
+    engine = conectar()
+    filtro = ""
+    params = {}
+    if not completo:
+        filtro = """
+            AND (tipo_papel IS NULL
+                 OR (tipo_papel = 'OPCAO' AND vencimento IS NULL)
+                 OR id >= :id_minimo)
+        """
+        params["id_minimo"] = id_minimo if id_minimo is not None else 0
+
+    query = text(f"""
+        SELECT id, tipo_mercado, especificacao, on_pn_strike, ativo_base, vencimento, data_registro,
+               tipo_papel AS tipo_papel_anterior
+        FROM notas 
+        WHERE (tipo_mercado LIKE 'OPCAO%' 
+               OR tipo_mercado IN ('EXERC OPC VENDA', 'EXERC OPC COMPRA', 'A VISTA', 'VISTA','FRACIONARIO'))
+        {filtro}
+    """)
+    df_notas = pd.read_sql(query, engine, params=params)
+    if df_notas.empty:
+        return []
+
+    novas = df_notas['tipo_papel_anterior'].isna()
+    if not completo:
+        novas |= df_notas['id'] >= params["id_minimo"]
+    classificadas = df_notas.loc[novas, 'id'].astype(int).tolist()
+
+    def definir_tipo_papel(tipo_mercado):
+        tipo = tipo_mercado.upper().strip()
+        if tipo in ['OPCAO DE VENDA', 'OPCAO DE COMPRA']:
+            return 'OPCAO'
+        elif tipo in ['EXERC OPC VENDA', 'EXERC OPC COMPRA', 'A VISTA','VISTA','FRACIONARIO']:
+            return 'ACAO'
+        else:
+            return 'ACAO'
 
-        df_notas['vencimento'] = df_notas.apply(
-            lambda row: encontrar_vencimento(row['letra_call_put'], row['data_registro']),
-            axis=1
-        )
+    df_notas['tipo_papel'] = df_notas['tipo_mercado'].apply(definir_tipo_papel)
+    df_notas['tipo_opcao'] = df_notas['tipo_mercado'].apply(
+        lambda x: 'CALL' if 'COMPRA' in x.upper() else ('PUT' if 'VENDA' in x.upper() else None)
+    )
 
-        with engine.begin() as conn:
-            for _, row in df_notas.iterrows():
-                conn.execute(text("""
-                    UPDATE notas
-                    SET tipo_papel = :tipo_papel,
-                        tipo_opcao = :tipo_opcao,
-                        strike = :strike,
-                        ativo_base = :ativo_base,
-                        letra_call_put = :letra_call_put,
-                        vencimento = :vencimento
-                    WHERE id = :id
-                """), {
-                    'tipo_papel': row['tipo_papel'],
-                    'tipo_opcao': row['tipo_opcao'] if pd.notna(row['tipo_opcao']) else None,
-                    'strike': row['strike'] if pd.notna(row['strike']) else None,
-                    'ativo_base': row['ativo_base'] if pd.notna(row['ativo_base']) else None,
-                    'letra_call_put': row['letra_call_put'] if pd.notna(row['letra_call_put']) else None,
-                    'vencimento': row['vencimento'] if pd.notna(row['vencimento']) else None,
-                    'id': row['id']
-                })
+    def extrair_strike(valor):
+        try:
+            if not isinstance(valor, str):
+                return None
+            valor_limpo = valor.strip().replace(',', '.')
+            match = re.search(r'(\d+\.\d+)', valor_limpo)
+            return float(match.group(1)) if match else None
+        except:
+            return None
 
-        return "✅ Notas importadas e atualizadas com sucesso!"
-    except Exception as e:
-        return f"❌ Erro ao importar ou atualizar notas: {e}"
+    df_notas['strike'] = df_notas['especificacao'].apply(extrair_strike)
+    df_notas['on_pn_strike'] = None
+    df_notas = df_notas.where(pd.notnull(df_notas), None)
+    df_notas['strike'] = df_notas['strike'].apply(lambda x: None if pd.isna(x) else x)
+    df_notas['letra_call_put'] = letra_da_opcao(df_notas['especificacao'])
+
+    df_vencimentos = pd.read_sql("SELECT codigo_letra, data_vencimento FROM vencimentos_opcoes", engine)
+
+    df_notas['vencimento'] = resolver_vencimentos(df_notas, df_vencimentos)
+
+    colunas = ['id', 'tipo_papel', 'tipo_opcao', 'strike', 'ativo_base', 'letra_call_put', 'vencimento']
+    atualizar_colunas_em_massa(engine, 'notas', df_notas[colunas])
+    incrementar_versao(engine, 'notas')
+    if completo:
+        # tipo_papel de notas antigas pode ter mudado
+        recalcular_premio_mensal(engine)
+
+    return classificadas
 
 def calcular_resultado_opcoes():
+    engine = conectar()
     hoje = pd.Timestamp(datetime.today().date())
 
+    garantir_ultimo_preco(engine)
+
+    # Vencidas: fechamento do dia do vencimento; vigentes: último fechamento (tabela ultimo_preco)
     query = """
     SELECT 
         n.id, n.ativo_base, n.tipo_opcao, n.strike, n.vencimento, n.data_registro,
-        h.preco_fechamento, COALESCE(SUM(p.valor), 0) AS total_proventos
+        COALESCE(hv.preco_fechamento, u.preco_fechamento) AS preco_fechamento,
+        COALESCE(SUM(p.valor), 0) AS total_proventos
     FROM notas n
-    LEFT JOIN (
-        SELECT codigo_bdi, MAX(data_pregao) AS data_mais_recente
-        FROM historico_precos
-        GROUP BY codigo_bdi
-    ) ult ON ult.codigo_bdi = n.ativo_base
-    LEFT JOIN historico_precos h ON h.codigo_bdi = n.ativo_base
-        AND (
-            (n.vencimento < %(hoje)s AND h.data_pregao = n.vencimento)
-            OR (n.vencimento >= %(hoje)s AND h.data_pregao = ult.data_mais_recente)
-        )
+    LEFT JOIN historico_precos hv ON hv.codigo_bdi = n.ativo_base
+        AND hv.data_pregao = n.vencimento
+        AND n.vencimento < %(hoje)s
+    LEFT JOIN ultimo_preco u ON u.codigo_bdi = n.ativo_base
+        AND n.vencimento >= %(hoje)s
     LEFT JOIN proventos p ON p.ativo = n.ativo_base
         AND p.data_com > n.data_registro AND p.data_com <= n.vencimento
     WHERE n.tipo_mercado LIKE 'OPCAO%%'
-    GROUP BY n.id, n.ativo_base, n.tipo_opcao, n.strike, n.vencimento, n.data_registro, h.preco_fechamento
+    GROUP BY n.id, n.ativo_base, n.tipo_opcao, n.strike, n.vencimento, n.data_registro,
+        hv.preco_fechamento, u.preco_fechamento
     """
 
     df = pd.read_sql(query, engine, params={"hoje": hoje})
@@ -285,38 +401,15 @@ def calcular_resultado_opcoes():
 
     df['strike_ajustado'] = df['strike'] - df['total_proventos']
 
-    def calcular_resultado(row):
-        vencida = row['vencimento'] < hoje
-        tipo = row['tipo_opcao']
-        preco = row['preco_fechamento']
-        strike = row['strike_ajustado']
-        if pd.isna(preco) or pd.isna(strike): return None
-
-        if vencida:
-            if tipo == 'CALL':
-                return 'Exercicio' if preco >= strike else 'Virou Pó'
-            elif tipo == 'PUT':
-                return 'Exercicio' if preco <= strike else 'Virou Pó'
-        else:
-            if tipo == 'CALL':
-                return 'Indo a Exercicio' if preco >= strike else 'Virando Pó'
-            elif tipo == 'PUT':
-                return 'Indo a Exercicio' if preco <= strike else 'Virando Pó'
-
-    df['resultado'] = df.apply(calcular_resultado, axis=1)
-
-    with engine.begin() as conn:
-        for _, row in df.iterrows():
-            if row['resultado']:
-                conn.execute(
-                    text("UPDATE notas SET resultado = :resultado WHERE id = :id"),
-                    {"resultado": row["resultado"], "id": row["id"]}
-                )
+    df['resultado'] = classificar_resultado(df, hoje)
+    gravar_resultados(engine, df)
+    incrementar_versao(engine, 'notas')
 
     print("Resultados das opções atualizados com sucesso.")
 
    
 def importar_proventos():
+    engine = conectar()
     arquivo = st.file_uploader("📥 Importar proventos (.xlsx)", type=["xlsx"])
     if arquivo:
         try:
@@ -338,198 +431,19 @@ def importar_proventos():
 
             # Inserção no banco
             df.to_sql('proventos', con=engine, if_exists='append', index=False)
+            registrar_pendencias_ativos(engine, df['ativo'])
+            incrementar_versao(engine, 'proventos')
             st.success("✅ Proventos importados com sucesso.")
         except Exception as e:
             st.error(f"❌ Erro ao importar proventos: {e}")
 
-def atualizar_historico_operacoes():
-    import pandas as pd
-    from sqlalchemy import text
-    from backend.conexao import conectar
-
-    # ------------------------------
-    # Leitura das tabelas
-    # ------------------------------
-    notas = pd.read_sql("SELECT * FROM notas", engine)
-    precos = pd.read_sql("SELECT * FROM historico_precos", engine)
-    prov = pd.read_sql("SELECT * FROM proventos", engine)
-
-    notas['data_registro'] = pd.to_datetime(notas['data_registro'], errors='coerce')
-    precos['data_pregao'] = pd.to_datetime(precos['data_pregao'], errors='coerce')
-    prov['data_com'] = pd.to_datetime(prov['data_com'], errors='coerce')
-
-    # ------------------------------
-    # Limpar histórico anterior
-    # ------------------------------
-    with engine.begin() as conn:
-        conn.execute(text("DELETE FROM historico_operacoes"))
-
-    # ------------------------------
-    # Separar ações e opções
-    # ------------------------------
-    acoes = notas[notas['tipo_papel'] == 'ACAO']
-    opcoes = notas[notas['tipo_papel'] == 'OPCAO']
-
-    # ------------------------------
-    # Quantidades e valores
-    # ------------------------------
-    compras = acoes[acoes['tipo_lado'] == 'C'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Quantidade_comprada=('quantidade', 'sum'),
-        Total_compras=('valor_operacao', 'sum'),
-        data_inicio=('data_registro', 'min')
-    ).reset_index()
-
-    # Preço médio
-    def safe_div(num, den):
-        return num / den if den != 0 else 0
-
-    compras['preco_medio'] = compras.apply(
-        lambda x: safe_div(x['Total_compras'], x['Quantidade_comprada']), axis=1
-    )
-
-    vendas = acoes[acoes['tipo_lado'] == 'V'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Quantidade_vendida=('quantidade', 'sum'),
-        Total_vendas=('valor_operacao', 'sum')
-    ).reset_index()
-
-    # Garantir data mínima para cada ativo
-    datas_todos_ativos = notas.groupby(['conta', 'cliente', 'ativo_base'])['data_registro'].min().reset_index()
-    datas_todos_ativos.rename(columns={'data_registro': 'data_inicio'}, inplace=True)
-
-    # ------------------------------
-    # Prêmios de opções
-    # ------------------------------
-    premios_recebidos = opcoes[opcoes['tipo_lado'] == 'V'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Premios_recebidos=('valor_operacao', 'sum')
-    ).reset_index()
-
-    premios_pagos = opcoes[opcoes['tipo_lado'] == 'C'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Premios_pagos=('valor_operacao', 'sum')
-    ).reset_index()
-
-    # ------------------------------
-    # Consolidar dados
-    # ------------------------------
-    consolidado = pd.merge(datas_todos_ativos, compras, on=['conta', 'cliente', 'ativo_base'], how='left')
-    consolidado = pd.merge(consolidado, vendas, on=['conta', 'cliente', 'ativo_base'], how='left')
-    consolidado = pd.merge(consolidado, premios_recebidos, on=['conta', 'cliente', 'ativo_base'], how='left')
-    consolidado = pd.merge(consolidado, premios_pagos, on=['conta', 'cliente', 'ativo_base'], how='left')
-
-    # Corrigir colunas de data_inicio
-    if 'data_inicio_x' in consolidado.columns and 'data_inicio_y' in consolidado.columns:
-        consolidado['data_inicio'] = consolidado[['data_inicio_x', 'data_inicio_y']].min(axis=1)
-        consolidado.drop(columns=['data_inicio_x', 'data_inicio_y'], inplace=True)
-    elif 'data_inicio_x' in consolidado.columns:
-        consolidado.rename(columns={'data_inicio_x': 'data_inicio'}, inplace=True)
-    elif 'data_inicio_y' in consolidado.columns:
-        consolidado.rename(columns={'data_inicio_y': 'data_inicio'}, inplace=True)
-
-    consolidado.fillna({
-        'Quantidade_comprada': 0,
-        'Total_compras': 0,
-        'Quantidade_vendida': 0,
-        'Total_vendas': 0,
-        'Premios_recebidos': 0,
-        'Premios_pagos': 0,
-        'preco_medio': 0
-    }, inplace=True)
-
-    # Quantidade e prêmios
-    consolidado['quantidade_atual'] = consolidado['Quantidade_comprada'] - consolidado['Quantidade_vendida']
-    consolidado['Premio_liquido'] = consolidado['Premios_recebidos'] - consolidado['Premios_pagos']
-
-    # ------------------------------
-    # Proventos
-    # ------------------------------
-    proventos_total = []
-    for _, row in consolidado.iterrows():
-        prov_ativo = prov[prov['ativo'] == row['ativo_base']]
-        total_provento = 0
-        for _, p in prov_ativo.iterrows():
-            qtd_ate_data = acoes[
-                (acoes['conta'] == row['conta']) &
-                (acoes['cliente'] == row['cliente']) &
-                (acoes['ativo_base'] == row['ativo_base']) &
-                (acoes['data_registro'] <= p['data_com'])
-            ]['quantidade'].sum()
-            total_provento += qtd_ate_data * p['valor']
-        proventos_total.append(total_provento)
-
-    consolidado['Proventos'] = proventos_total
-
-    # ------------------------------
-    # Preços
-    # ------------------------------
-    ativos_yahoo = pd.read_sql("SELECT DISTINCT asset_original, preco_atual FROM ativos_yahoo", engine)
-    precos = precos.drop_duplicates(subset=['codigo_bdi','data_pregao'])
-
-    consolidado = pd.merge(
-        consolidado,
-        ativos_yahoo[['asset_original', 'preco_atual']],
-        left_on='ativo_base',
-        right_on='asset_original',
-        how='left'
-    )
-
-    consolidado['preco_fechamento'] = consolidado['preco_atual'].fillna(0)
-    consolidado.drop(columns=['asset_original', 'preco_atual'], inplace=True)
-
-    preco_inicio = pd.merge(
-        notas.groupby('ativo_base')['data_registro'].min().reset_index(),
-        precos, left_on=['ativo_base', 'data_registro'], right_on=['codigo_bdi', 'data_pregao'], how='left'
-    )[['ativo_base', 'preco_fechamento']].rename(columns={'preco_fechamento': 'preco_fechamento_inicio_operacoes'})
-
-    preco_inicio = preco_inicio.drop_duplicates(subset=['ativo_base'])
-
-    consolidado = pd.merge(consolidado, preco_inicio, on='ativo_base', how='left')
-    consolidado.rename(columns={'preco_fechamento': 'preco_fechamento'}, inplace=True)
-
-    # ------------------------------
-    # Cálculos finais e rentabilidades
-    # ------------------------------
-    consolidado['Posicao_atual'] = consolidado['quantidade_atual'] * consolidado['preco_fechamento']
-    consolidado['investido'] = consolidado['quantidade_atual'] * consolidado['preco_medio']
-
-    consolidado['resultado_sem_opcoes'] = consolidado['Posicao_atual'] - consolidado['investido']
-    consolidado['resultado_com_opcoes'] = consolidado['resultado_sem_opcoes'] + consolidado['Premio_liquido']
-
-    consolidado['Rentabilidade_sem_premio'] = consolidado.apply(
-        lambda x: safe_div(x['Total_vendas'] + x['Posicao_atual'] - x['Total_compras'], x['Total_compras']), axis=1)
-    consolidado['Rentabilidade_com_premio'] = consolidado.apply(
-        lambda x: safe_div(x['Total_vendas'] + x['Posicao_atual'] + x['Premio_liquido'] - x['Total_compras'], x['Total_compras']), axis=1)
-    consolidado['Rentabilidade_com_proventos'] = consolidado.apply(
-        lambda x: safe_div(x['Total_vendas'] + x['Posicao_atual'] + x['Proventos'] - x['Total_compras'], x['Total_compras']), axis=1)
-    consolidado['Rentabilidade_com_proventos_premios'] = consolidado.apply(
-        lambda x: safe_div(x['Total_vendas'] + x['Posicao_atual'] + x['Proventos'] + x['Premio_liquido'] - x['Total_compras'], x['Total_compras']), axis=1)
-    
-        # Preço médio de venda (Total Vendas / Quantidade Vendida)
-    consolidado['preco_medio_vendas'] = consolidado.apply(
-        lambda x: safe_div(x['Total_vendas'], x['Quantidade_vendida']), axis=1)
-
-    # Rentabilidade em reais (valor absoluto)
-
-    # Sem opção: (Preço médio de venda - Preço médio de compra) * Quantidade vendida
-    consolidado['rentabilidade_venda_sem_premio'] = (consolidado['preco_medio_vendas'] - consolidado['preco_medio']) * consolidado['Quantidade_vendida']
-
-    # Com prêmio: rentabilidade sem prêmio + prêmios recebidos (em reais)
-    consolidado['rentabilidade_venda_com_premio'] = consolidado['rentabilidade_venda_sem_premio'] + consolidado['Premios_recebidos']
-
-    consolidado['variacao_ativo'] = consolidado.apply(
-        lambda x: safe_div(x['preco_fechamento'] - x['preco_fechamento_inicio_operacoes'], x['preco_fechamento_inicio_operacoes']), axis=1)
-
-    # ------------------------------
-    # Garantir que não haja duplicados antes de salvar
-    # ------------------------------
-    consolidado = consolidado.drop_duplicates(subset=['conta','cliente','ativo_base'])
-
-    
-
-    # ------------------------------
-    # Salvar no banco
-    # ------------------------------
-    consolidado.to_sql('historico_operacoes', engine, if_exists='append', index=False)
-    print("Histórico de operações atualizado com sucesso")
-
+def atualizar_historico_operacoes(completo=False):
+    """Recalcula as posições afetadas desde a última execução (ou todas, com `completo=True`)."""
+    engine = conectar()
+    total = reconstruir_historico(engine, completo=completo)
+    incrementar_versao(engine, 'historico_operacoes')
+    print(f"Histórico de operações atualizado com sucesso ({total} posições)")
+    return total
 
 
 def atualizar_asset_yahoo(engine=None):
@@ -552,6 +466,7 @@ def atualizar_asset_yahoo(engine=None):
                 "asset_yahoo": row["asset_yahoo"],
                 "asset_original": row["asset_original"]
             })
+    incrementar_versao(engine, 'ativos_yahoo')
 
     print("Coluna asset_yahoo atualizada com sucesso!")
 
@@ -573,141 +488,83 @@ def importar_ativos_livres(arquivo, engine):
             st.write("🔍 Pré-visualização dos dados importados:")
             st.dataframe(df[['Ativo', 'Preco_Medio', 'Preco_Atual']].head())
 
+            # DDL fora da transação (ALTER TABLE faz commit implícito no MySQL)
+            chaves_normalizadas = garantir_chaves_normalizadas(engine)
+            # Lida antes do recálculo: se ativos_yahoo mudar no meio, a derivação continua pendente
+            versao_precos, = versoes(engine, ['ativos_yahoo'])
             with engine.begin() as conn:
                 conn.execute(text("DELETE FROM ativos_livres"))
                 df.to_sql('ativos_livres', con=conn, if_exists='append', index=False)
 
-                # Atualizar Preco_Atual com base na tabela ativos_yahoo
-                conn.execute(text("""
-                    UPDATE ativos_livres AS al
-                    JOIN ativos_yahoo AS ay ON UPPER(TRIM(al.Ativo)) = UPPER(TRIM(ay.asset_original))
-                    SET al.Preco_Atual = ay.Preco_Atual
-                """))
-
-                # Calcular Rentabilidade apenas quando Preco_Medio é válido
-                conn.execute(text("""
-                    UPDATE ativos_livres
-                    SET Rentabilidade = ROUND(((Preco_Atual - Preco_Medio) / Preco_Medio) * 100, 2)
-                    WHERE Preco_Medio IS NOT NULL AND Preco_Medio > 0
-                """))
-
-                # Zerar Rentabilidade onde Preco_Medio é inválido
-                conn.execute(text("""
-                    UPDATE ativos_livres
-                    SET Rentabilidade = NULL
-                    WHERE Preco_Medio IS NULL OR Preco_Medio = 0
-                """))
-
-                # Calcular o volume livre
-                conn.execute(text("""
-                    UPDATE ativos_livres
-                    SET Volume_Livre = ROUND(Qtde_livre * Preco_Atual, 2)
-                    WHERE Qtde_livre IS NOT NULL AND Preco_Atual IS NOT NULL
-                """))
+                # Preco_Atual, Rentabilidade e Volume_Livre num único UPDATE
+                recalcular_derivados(conn, chaves_normalizadas)
+            incrementar_versao(engine, 'ativos_livres')
+            # Os derivados já saíram desta carga: o próximo filtro não precisa refazer o UPDATE
+            versao_livres, = versoes(engine, ['ativos_livres'])
+            registrar_derivacao(engine, 'ativos_livres', (versao_precos, versao_livres))
 
             st.success("✅ Ativos livres importados e atualizados com sucesso.")
         except Exception as e:
             st.error(f"❌ Erro ao importar ativos livres: {e}")
 
-def atualizar_preco_atual_ativos_livres():
-    
-   """ etapas = [
-        "Atualizando preços dos ativos...",
-        "Calculando rentabilidade válida...",
-        "Zerando rentabilidade inválida...",
-        "Calculando volume livre..."
-    ] """
-
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    with engine.begin() as conn:
-        # Etapa 1
-        status_text.text(etapas[0])
-        conn.execute(text("""
-            UPDATE ativos_livres AS al
-            JOIN ativos_yahoo AS ay
-              ON UPPER(TRIM(al.Ativo)) = UPPER(TRIM(ay.asset_original))
-            SET al.Preco_Atual = ay.preco_atual
-        """))
-        progress_bar.progress(0.25)
-
-        # Etapa 2
-        status_text.text(etapas[1])
-        conn.execute(text("""
-            UPDATE ativos_livres
-            SET Rentabilidade = ROUND(((Preco_Atual - Preco_Medio) / Preco_Medio) * 100, 2)
-            WHERE Preco_Medio IS NOT NULL AND Preco_Medio > 0
-              AND Preco_Atual IS NOT NULL
-        """))
-        progress_bar.progress(0.5)
-
-        # Etapa 3
-        status_text.text(etapas[2])
-        conn.execute(text("""
-            UPDATE ativos_livres
-            SET Rentabilidade = NULL
-            WHERE Preco_Medio IS NULL OR Preco_Medio = 0
-        """))
-        progress_bar.progress(0.75)
-
-        # Etapa 4
-        status_text.text(etapas[3])
-        conn.execute(text("""
-            UPDATE ativos_livres
-            SET Volume_Livre = ROUND(Qtde_livre * Preco_Atual, 2)
-            WHERE Qtde_livre IS NOT NULL AND Preco_Atual IS NOT NULL
-        """))
-        progress_bar.progress(1.0)
+def atualizar_preco_atual_ativos_livres(forcar=False):
+    """Recalcula Preco_Atual, Rentabilidade e Volume_Livre de ativos_livres.
 
-    status_text.text("✅ Atualização concluída com sucesso.")
-    st.success("Todos os dados foram atualizados com sucesso.")
+    Só executa quando ativos_yahoo ou ativos_livres mudaram desde o último
+    recálculo (ou com `forcar=True`). Retorna True se recalculou.
+    """
+    return atualizar_derivados(conectar(), forcar=forcar)
 
 
-def consolidar_notas_simples(data_inicio, data_fim, engine):
-    import pandas as pd
+def consolidar_notas_simples(data_inicio, data_fim, engine, cliente=None, ativo=None, tipo_posicao=None):
+    """Compras, vendas e prêmios por (conta, cliente, ativo_base) no período, agregados no banco.
 
-    notas = pd.read_sql("""
-        SELECT conta, cliente, ativo_base, tipo_papel, tipo_lado, quantidade, valor_operacao, data_registro
+    `cliente` (trecho do nome), `ativo` e `tipo_posicao` ('ativas' ou 'zeradas')
+    viram WHERE/HAVING: só o resultado agregado e filtrado sai do banco.
+    """
+    garantir_indices_notas(engine)  # data_registro indexado para o BETWEEN
+
+    def soma(tipo_papel, tipo_lado, coluna):
+        return (f"SUM(CASE WHEN tipo_papel = '{tipo_papel}' AND tipo_lado = '{tipo_lado}' "
+                f"THEN COALESCE({coluna}, 0) ELSE 0 END)")
+
+    condicoes = [
+        "data_registro BETWEEN :data_inicio AND :data_fim",
+        "tipo_papel IN ('ACAO', 'OPCAO')",
+        "tipo_lado IN ('C', 'V')",
+        "conta IS NOT NULL AND cliente IS NOT NULL AND ativo_base IS NOT NULL",
+    ]
+    params = {"data_inicio": data_inicio, "data_fim": data_fim}
+    if cliente:
+        condicoes.append(contendo("cliente", "cliente"))
+        params["cliente"] = padrao_contendo(cliente)
+    if ativo:
+        condicoes.append("ativo_base = :ativo")
+        params["ativo"] = ativo
+
+    having = ""
+    if tipo_posicao == 'ativas':
+        having = "HAVING quantidade_atual > 0"
+    elif tipo_posicao == 'zeradas':
+        having = "HAVING quantidade_atual <= 0"
+
+    query = text(f"""
+        SELECT conta, cliente, ativo_base,
+               {soma('ACAO', 'C', 'quantidade')} AS Quantidade_comprada,
+               {soma('ACAO', 'C', 'valor_operacao')} AS Total_compras,
+               {soma('ACAO', 'V', 'quantidade')} AS Quantidade_vendida,
+               {soma('ACAO', 'V', 'valor_operacao')} AS Total_vendas,
+               {soma('OPCAO', 'V', 'valor_operacao')} AS Premio_recebido,
+               {soma('OPCAO', 'C', 'valor_operacao')} AS Premio_pago,
+               {soma('ACAO', 'C', 'quantidade')} - {soma('ACAO', 'V', 'quantidade')} AS quantidade_atual,
+               {soma('OPCAO', 'V', 'valor_operacao')} - {soma('OPCAO', 'C', 'valor_operacao')} AS Premio_liquido
         FROM notas
-        WHERE data_registro BETWEEN %s AND %s
-    """, engine, params=(data_inicio, data_fim))
-
-    # Separar ações e opções
-    acoes = notas[notas['tipo_papel'] == 'ACAO']
-    opcoes = notas[notas['tipo_papel'] == 'OPCAO']
-
-    # Agrupamento de compras e vendas
-    compras = acoes[acoes['tipo_lado'] == 'C'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Quantidade_comprada=('quantidade', 'sum'),
-        Total_compras=('valor_operacao', 'sum')
-    )
-
-    vendas = acoes[acoes['tipo_lado'] == 'V'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Quantidade_vendida=('quantidade', 'sum'),
-        Total_vendas=('valor_operacao', 'sum')
-    )
-
-    # Prêmios
-    premios_recebidos = opcoes[opcoes['tipo_lado'] == 'V'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Premio_recebido=('valor_operacao', 'sum')
-    )
-
-    premios_pagos = opcoes[opcoes['tipo_lado'] == 'C'].groupby(['conta', 'cliente', 'ativo_base']).agg(
-        Premio_pago=('valor_operacao', 'sum')
-    )
-
-    # Consolidação
-    consolidado = compras.join(vendas, how='outer').join(premios_recebidos, how='outer').join(premios_pagos, how='outer')
-    consolidado = consolidado.fillna(0)
-
-    consolidado['quantidade_atual'] = consolidado['Quantidade_comprada'] - consolidado['Quantidade_vendida']
-    consolidado['Premio_liquido'] = consolidado['Premio_recebido'] - consolidado['Premio_pago']
-
-    consolidado = consolidado.reset_index()
+        WHERE {' AND '.join(condicoes)}
+        GROUP BY conta, cliente, ativo_base
+        {having}
+        ORDER BY conta, cliente, ativo_base
+    """)
+    consolidado = pd.read_sql(query, engine, params=params)
+    numericas = consolidado.columns[3:]
+    consolidado[numericas] = consolidado[numericas].astype(float)
     return consolidado
-
-
-
-
-
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+
+def classificar_resultado(df, hoje):
+    """Classifica as opções pela relação entre preço e strike ajustado, coluna a coluna.
+
+    Usa as colunas vencimento, tipo_opcao, preco_fechamento e strike_ajustado.
+    Retorna 'Exercicio'/'Virou Pó' para as vencidas, 'Indo a Exercicio'/'Virando Pó'
+    para as vigentes e NaN quando falta preço, strike ou tipo.
+    """
+    preco = df['preco_fechamento'].to_numpy(dtype=float)
+    strike = df['strike_ajustado'].to_numpy(dtype=float)
+    tipo = df['tipo_opcao'].to_numpy()
+    vencida = (pd.to_datetime(df['vencimento']) < hoje).to_numpy()
+
+    call = tipo == 'CALL'
+    put = tipo == 'PUT'
+    valido = ~np.isnan(preco) & ~np.isnan(strike) & (call | put)
+    no_dinheiro = (call & (preco >= strike)) | (put & (preco <= strike))
+
+    resultado = np.select(
+        [vencida & no_dinheiro, vencida, no_dinheiro],
+        ['Exercicio', 'Virou Pó', 'Indo a Exercicio'],
+        default='Virando Pó'
+    )
+    return pd.Series(resultado, index=df.index, dtype=object).where(valido)
+
+
+def gravar_resultados(engine, df, tamanho_lote=10_000):
+    """Grava a coluna resultado com um UPDATE ... WHERE id IN (...) por resultado (e por lote de ids)."""
+    query = text("UPDATE notas SET resultado = :resultado WHERE id IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    alteradas = 0
+    with engine.begin() as conn:
+        for resultado, grupo in df.dropna(subset=['resultado']).groupby('resultado')['id']:
+            ids = grupo.astype(int).tolist()
+            for i in range(0, len(ids), tamanho_lote):
+                alteradas += conn.execute(query, {"resultado": resultado, "ids": ids[i:i + tamanho_lote]}).rowcount
+    return alteradas
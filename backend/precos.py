@@ -0,0 +1,123 @@
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+
+def ticker_yahoo(asset_original):
+    return str(asset_original).strip().upper() + ".SA"
+
+
+# ------------------------------
+# Provedores de cotação
+# ------------------------------
+class ProvedorYahoo:
+    """Busca o último fechamento de vários tickers em um único download do Yahoo."""
+
+    def cotacoes(self, tickers):
+        import yfinance as yf
+
+        dados = yf.download(
+            tickers, period="1d", group_by="ticker",
+            auto_adjust=True, threads=False, progress=False
+        )
+
+        precos = {}
+        for ticker in tickers:
+            try:
+                if isinstance(dados.columns, pd.MultiIndex):
+                    serie = dados[ticker]["Close"]
+                else:
+                    serie = dados["Close"]
+                serie = serie.dropna()
+                precos[ticker] = round(float(serie.iloc[-1]), 2) if not serie.empty else None
+            except KeyError:
+                precos[ticker] = None
+        return precos
+
+
+class ProvedorFalso:
+    """Provedor local, sem rede, para testes e benchmarks do motor de atualização.
+
+    Cada chamada simula uma requisição com `latencia` segundos e devolve um preço
+    determinístico por ticker; os tickers em `falhas` voltam sem preço.
+    """
+
+    def __init__(self, latencia=0.0, falhas=()):
+        self.latencia = latencia
+        self.falhas = set(falhas)
+        self.chamadas = 0
+
+    def cotacoes(self, tickers):
+        self.chamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        return {
+            t: None if t in self.falhas else round(1 + zlib.crc32(t.encode()) % 10000 / 100, 2)
+            for t in tickers
+        }
+
+
+# ------------------------------
+# Motor de atualização
+# ------------------------------
+def buscar_cotacoes(assets, provedor=None, tamanho_lote=50, max_workers=4, ao_progredir=None):
+    """Busca as cotações de `assets` em lotes, distribuídos num pool limitado de threads.
+
+    Retorna {asset_original: preco}, com None para os ativos que falharam.
+    `ao_progredir(concluidos, total)` é chamado na thread de quem chamou, a cada lote.
+    """
+    provedor = provedor or ProvedorYahoo()
+    assets = list(dict.fromkeys(assets))
+    total = len(assets)
+    resultado = {asset: None for asset in assets}
+    if total == 0:
+        return resultado
+
+    lotes = [assets[i:i + tamanho_lote] for i in range(0, total, tamanho_lote)]
+
+    def buscar_lote(lote):
+        tickers = {ticker_yahoo(asset): asset for asset in lote}
+        try:
+            precos = provedor.cotacoes(list(tickers))
+        except Exception as e:
+            print(f"Erro ao obter preços do lote {lote[0]}..{lote[-1]}: {e}")
+            precos = {}
+        return {asset: precos.get(ticker) for ticker, asset in tickers.items()}
+
+    concluidos = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(lotes)))) as pool:
+        futuros = {pool.submit(buscar_lote, lote): lote for lote in lotes}
+        for futuro in as_completed(futuros):
+            resultado.update(futuro.result())
+            concluidos += len(futuros[futuro])
+            if ao_progredir:
+                ao_progredir(concluidos, total)
+
+    return resultado
+
+
+def atualizar_precos_ativos(engine, assets, provedor=None, tamanho_lote=50, max_workers=4, ao_progredir=None):
+    """Busca as cotações de `assets` e grava as obtidas em ativos_yahoo numa única transação.
+
+    Retorna ({asset_original: preco}, linhas alteradas), com None para os ativos que falharam.
+    """
+    from backend.importacao import atualizar_precos
+
+    resultado = buscar_cotacoes(assets, provedor, tamanho_lote, max_workers, ao_progredir)
+    linhas = atualizar_precos(engine, resultado)
+    return resultado, linhas
+
+
+# Execução agendada (cron/Task Scheduler): python -m backend.precos
+if __name__ == "__main__":
+    from backend.conexao import conectar
+    from backend.importacao import obter_lista_assets
+
+    engine = conectar()
+    resultado, linhas = atualizar_precos_ativos(engine, obter_lista_assets(engine)['asset_original'].tolist())
+    falhas = [asset for asset, preco in resultado.items() if preco is None]
+    print(f"{linhas} linhas de ativos_yahoo atualizadas.")
+    if falhas:
+        print(f"Falha ao atualizar: {', '.join(falhas)}")
@@ -0,0 +1,108 @@
+import pandas as pd
+from sqlalchemy import text
+
+from backend.esquema import coluna_existe, garantir_coluna, garantir_indice, garantir_tabela
+from backend.filtros import contendo, padrao_contendo
+
+# Prêmios de opções por mês, mantidos a cada importação de notas.
+# Chaves nulas nas notas viram 0/'' porque fazem parte da chave primária.
+DDL_PREMIO_MENSAL = """
+    CREATE TABLE IF NOT EXISTS premio_mensal (
+        conta BIGINT NOT NULL,
+        cliente VARCHAR(255) NOT NULL,
+        ano SMALLINT NOT NULL,
+        mes TINYINT NOT NULL,
+        ativo_base VARCHAR(20) NOT NULL,
+        premio_recebido DECIMAL(18, 2) NOT NULL DEFAULT 0,
+        premio_pago DECIMAL(18, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (conta, cliente, ano, mes, ativo_base),
+        KEY ix_premio_mensal_ano_cliente (ano, cliente)
+    )
+"""
+
+
+def _garantir_estrutura(engine):
+    """Cria premio_mensal e a marca notas.premio_somado. Retorna True se a marca acabou de ser criada."""
+    garantir_tabela(engine, 'premio_mensal', DDL_PREMIO_MENSAL)
+    if coluna_existe(engine, 'notas', 'premio_somado'):
+        return False
+    garantir_coluna(engine, 'notas', 'premio_somado', "TINYINT NOT NULL DEFAULT 0")
+    garantir_indice(engine, 'notas', 'ix_notas_premio_pendente', ['tipo_papel', 'premio_somado'])
+    return True
+
+
+def garantir_premio_mensal(engine):
+    """Migração, chamada pela importação de notas e pelo painel admin (nunca na leitura).
+
+    Na primeira vez o resumo é preenchido do zero, coerente com a marca premio_somado.
+    """
+    if _garantir_estrutura(engine):
+        recalcular_premio_mensal(engine)
+
+
+# Notas de opções que ainda não entraram no resumo
+PENDENTES = "premio_somado = 0 AND tipo_papel = 'OPCAO' AND data_registro IS NOT NULL"
+
+
+def somar_premios(conn):
+    """Soma ao resumo as notas de opções ainda não somadas e as marca como somadas.
+
+    Soma e marca vão na transação de `conn`: cada nota entra no resumo uma única vez,
+    mesmo que uma importação anterior tenha falhado antes desta etapa.
+    """
+    conn.execute(text(f"""
+        INSERT INTO premio_mensal (conta, cliente, ano, mes, ativo_base, premio_recebido, premio_pago)
+        SELECT COALESCE(conta, 0), COALESCE(cliente, ''), YEAR(data_registro), MONTH(data_registro),
+               COALESCE(ativo_base, ''),
+               SUM(CASE WHEN tipo_lado = 'V' THEN valor_operacao ELSE 0 END),
+               SUM(CASE WHEN tipo_lado = 'C' THEN valor_operacao ELSE 0 END)
+        FROM notas
+        WHERE {PENDENTES}
+        GROUP BY 1, 2, 3, 4, 5
+        ON DUPLICATE KEY UPDATE
+            premio_recebido = premio_recebido + VALUES(premio_recebido),
+            premio_pago = premio_pago + VALUES(premio_pago)
+    """))
+    conn.execute(text(f"UPDATE notas SET premio_somado = 1 WHERE {PENDENTES}"))
+
+
+def recalcular_premio_mensal(engine):
+    """Reconstrói premio_mensal a partir de todas as notas (painel admin e migração)."""
+    _garantir_estrutura(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM premio_mensal"))
+        conn.execute(text("UPDATE notas SET premio_somado = 0 WHERE premio_somado <> 0"))
+        somar_premios(conn)
+
+
+def consultar_premio_mensal(engine, ano, cliente=None):
+    """Prêmio líquido por cliente e mês do `ano` (vazio se nenhum ano foi escolhido)."""
+    if ano is None:
+        return pd.DataFrame({'cliente': pd.Series(dtype=object), 'ano': pd.Series(dtype=int),
+                             'mes': pd.Series(dtype=int), 'premio_total': pd.Series(dtype=float)})
+    return _consultar(engine, int(ano), cliente)
+
+
+def consultar_premio_todos_anos(engine, cliente=None):
+    """Prêmio líquido por cliente e mês de todos os anos, para a tendência."""
+    return _consultar(engine, None, cliente)
+
+
+def _consultar(engine, ano, cliente):
+    garantir_tabela(engine, 'premio_mensal', DDL_PREMIO_MENSAL)
+    condicoes, params = [], {}
+    if ano is not None:
+        condicoes.append("ano = :ano")
+        params["ano"] = ano
+    if cliente:
+        condicoes.append(contendo("cliente", "cliente"))
+        params["cliente"] = padrao_contendo(cliente)
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    df = pd.read_sql(text(f"""
+        SELECT cliente, ano, mes, SUM(premio_recebido - premio_pago) AS premio_total
+        FROM premio_mensal
+        {where}
+        GROUP BY cliente, ano, mes
+        ORDER BY cliente, ano, mes
+    """), engine, params=params)
+    return df.astype({'premio_total': float})
@@ -0,0 +1,34 @@
+import pandas as pd
+
+CHAVES = ['conta', 'cliente', 'ativo_base']
+
+
+def calcular_proventos(posicoes, acoes, prov):
+    """Total de proventos de cada posição (conta, cliente, ativo_base) de `posicoes`.
+
+    Para cada provento do ativo, multiplica `valor` pela quantidade acumulada nas
+    notas de ações até a data_com. A série acumulada por chave é montada uma vez
+    e cruzada com todas as data_com num único merge_asof.
+    Retorna um array alinhado às linhas de `posicoes`.
+    """
+    movimentos = (
+        acoes.dropna(subset=['data_registro'])
+        .groupby(CHAVES + ['data_registro'], as_index=False)['quantidade'].sum()
+        .sort_values('data_registro', kind='stable')
+    )
+    movimentos['quantidade_acumulada'] = movimentos.groupby(CHAVES)['quantidade'].cumsum()
+
+    eventos = (
+        posicoes[CHAVES].drop_duplicates()
+        .merge(prov[['ativo', 'data_com', 'valor']].dropna(subset=['data_com']),
+               left_on='ativo_base', right_on='ativo')
+        .sort_values('data_com', kind='stable')
+    )
+    eventos = pd.merge_asof(
+        eventos, movimentos[CHAVES + ['data_registro', 'quantidade_acumulada']],
+        left_on='data_com', right_on='data_registro', by=CHAVES, direction='backward'
+    )
+    eventos['Proventos'] = eventos['quantidade_acumulada'].fillna(0) * eventos['valor']
+
+    total = eventos.groupby(CHAVES, as_index=False)['Proventos'].sum()
+    return posicoes[CHAVES].merge(total, on=CHAVES, how='left')['Proventos'].fillna(0).to_numpy()
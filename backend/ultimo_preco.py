@@ -0,0 +1,69 @@
+from sqlalchemy import text
+
+from backend.carga_em_massa import registros
+from backend.esquema import garantir_tabela
+
+DDL_ULTIMO_PRECO = """
+    CREATE TABLE IF NOT EXISTS ultimo_preco (
+        codigo_bdi VARCHAR(20) NOT NULL PRIMARY KEY,
+        data_pregao DATE NOT NULL,
+        preco_fechamento DECIMAL(18, 2)
+    )
+"""
+
+
+def garantir_ultimo_preco(engine):
+    """Cria a tabela ultimo_preco se preciso e a preenche quando estiver vazia."""
+    garantir_tabela(engine, 'ultimo_preco', DDL_ULTIMO_PRECO)
+    with engine.connect() as conn:
+        vazia = conn.execute(text("SELECT COUNT(*) FROM ultimo_preco")).scalar() == 0
+    if vazia:
+        recalcular_ultimo_preco(engine)
+
+
+# Só avança a data de cada ativo: cargas de períodos antigos não sobrescrevem um fechamento mais recente
+ATUALIZACAO = """
+    ON DUPLICATE KEY UPDATE
+        preco_fechamento = IF(VALUES(data_pregao) >= ultimo_preco.data_pregao,
+                              VALUES(preco_fechamento), ultimo_preco.preco_fechamento),
+        data_pregao = GREATEST(ultimo_preco.data_pregao, VALUES(data_pregao))
+"""
+
+
+def atualizar_ultimo_preco(conn, df):
+    """Atualiza ultimo_preco com o lote `df` recém-carregado no historico_precos.
+
+    O último fechamento de cada ativo sai do próprio lote, sem reler o historico_precos.
+    """
+    # Com chave (data_pregao, codigo_bdi) duplicada no lote, o INSERT IGNORE manteve a primeira linha
+    ultimos = (
+        df[['codigo_bdi', 'data_pregao', 'preco_fechamento']]
+        .dropna(subset=['codigo_bdi', 'data_pregao'])
+        .drop_duplicates(subset=['codigo_bdi', 'data_pregao'])
+        .sort_values('data_pregao', kind='stable')
+        .drop_duplicates(subset=['codigo_bdi'], keep='last')
+    )
+    if ultimos.empty:
+        return
+    conn.execute(text(f"""
+        INSERT INTO ultimo_preco (codigo_bdi, data_pregao, preco_fechamento)
+        VALUES (:codigo_bdi, :data_pregao, :preco_fechamento)
+        {ATUALIZACAO}
+    """), registros(ultimos))
+
+
+def recalcular_ultimo_preco(engine):
+    """Reconstrói ultimo_preco a partir de todo o historico_precos."""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM ultimo_preco"))
+        conn.execute(text(f"""
+            INSERT INTO ultimo_preco (codigo_bdi, data_pregao, preco_fechamento)
+            SELECT h.codigo_bdi, h.data_pregao, h.preco_fechamento
+            FROM historico_precos h
+            JOIN (
+                SELECT codigo_bdi, MAX(data_pregao) AS data_pregao
+                FROM historico_precos
+                GROUP BY codigo_bdi
+            ) m ON m.codigo_bdi = h.codigo_bdi AND m.data_pregao = h.data_pregao
+            {ATUALIZACAO}
+        """))
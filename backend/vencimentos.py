@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+
+def letra_da_opcao(codigos):
+    """Letra de vencimento/tipo (5º caractere) de códigos de opção, ex.: 'PETRF325' -> 'F'."""
+    return codigos.str[4]
+
+
+def resolver_vencimentos(df, df_vencimentos, coluna_letra='letra_call_put', coluna_data='data_registro'):
+    """Primeiro data_vencimento posterior a `coluna_data`, para a mesma letra de vencimento.
+
+    Resolve todas as linhas de `df` num único merge_asof contra `df_vencimentos`
+    (colunas codigo_letra e data_vencimento). Retorna uma Series alinhada ao
+    índice de `df`, com NaT onde não há vencimento.
+    """
+    notas = pd.DataFrame({
+        'codigo_letra': df[coluna_letra].to_numpy(),
+        'data': pd.to_datetime(df[coluna_data], errors='coerce').to_numpy(),
+        'posicao': np.arange(len(df)),
+    }).dropna(subset=['codigo_letra', 'data']).sort_values('data', kind='stable')
+
+    vencimentos = pd.DataFrame({
+        'codigo_letra': df_vencimentos['codigo_letra'].to_numpy(),
+        'data': pd.to_datetime(df_vencimentos['data_vencimento'], errors='coerce').to_numpy(),
+    }).dropna().sort_values('data', kind='stable')
+    vencimentos['data_vencimento'] = vencimentos['data']
+
+    notas['codigo_letra'] = notas['codigo_letra'].astype(str)
+    vencimentos['codigo_letra'] = vencimentos['codigo_letra'].astype(str)
+
+    resolvidos = pd.merge_asof(
+        notas, vencimentos, on='data', by='codigo_letra',
+        direction='forward', allow_exact_matches=False
+    )
+
+    resultado = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+    resultado[resolvidos['posicao'].to_numpy()] = resolvidos['data_vencimento'].to_numpy()
+    return pd.Series(resultado, index=df.index, name='vencimento')
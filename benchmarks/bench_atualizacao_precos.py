@@ -0,0 +1,28 @@
+# Compara a atualização serial (um ticker por requisição) com o motor em lotes,
+# usando o ProvedorFalso (sem rede). Uso: python benchmarks/bench_atualizacao_precos.py
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.precos import ProvedorFalso, buscar_cotacoes
+
+N_ATIVOS = 300
+LATENCIA = 0.05  # segundos por requisição simulada
+
+assets = [f"ATV{i:03d}" for i in range(N_ATIVOS)]
+
+cenarios = [
+    ("serial (1 ticker, 1 worker)", 1, 1),
+    ("lotes de 50, 1 worker", 50, 1),
+    ("lotes de 50, 4 workers", 50, 4),
+    ("lotes de 25, 8 workers", 25, 8),
+]
+
+for nome, tamanho_lote, max_workers in cenarios:
+    provedor = ProvedorFalso(latencia=LATENCIA)
+    inicio = time.perf_counter()
+    resultado = buscar_cotacoes(assets, provedor, tamanho_lote=tamanho_lote, max_workers=max_workers)
+    duracao = time.perf_counter() - inicio
+    ok = sum(p is not None for p in resultado.values())
+    print(f"{nome:<30} {duracao:7.2f}s  {provedor.chamadas:4d} requisições  {ok}/{N_ATIVOS} preços")
@@ -0,0 +1,67 @@
+# Compara o parser antigo (decode + splitlines + read_fwf) com o leitor em lotes
+# de backend.cotahist num COTAHIST sintético. Uso: python benchmarks/bench_cotahist.py [registros]
+import sys
+import os
+import io
+import time
+import random
+import tracemalloc
+from io import StringIO
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.cotahist import ler_cotahist_em_lotes
+
+N_REGISTROS = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+
+def gerar_cotahist(n):
+    random.seed(0)
+    linhas = ['00COTAHIST.2024BOVESPA 20240102'.ljust(245)]
+    for i in range(n):
+        precos = ''.join(f"{random.randint(0, 10**8):013d}" for _ in range(5))
+        linha = (
+            f"012024{random.randint(1, 12):02d}{random.randint(1, 28):02d}02"
+            f"{'ATIV' + str(i % 400):<12}010{'EMPRESA ' + str(i % 400):<12}{'ON NM':<10}"
+        ).ljust(56) + precos
+        linha = linha.ljust(152) + f"{random.randint(0, 10**15):018d}"
+        linhas.append(linha.ljust(245))
+    linhas.append('99COTAHIST.2024BOVESPA 20240102'.ljust(245))
+    return '\r\n'.join(linhas).encode('latin1')
+
+
+def parser_antigo(conteudo):
+    colspecs = [
+        (2, 10), (12, 24), (24, 36), (27, 39), (39, 49),
+        (56, 69), (69, 82), (82, 95), (95, 108), (108, 121), (152, 170)
+    ]
+    colnames = [
+        'data_pregao', 'codigo_bdi', 'codigo_negociacao', 'nome_empresa',
+        'especificacao_papel', 'preco_abertura', 'preco_maximo',
+        'preco_minimo', 'preco_medio', 'preco_fechamento', 'volume'
+    ]
+    linhas = conteudo.decode('latin1').splitlines()
+    linhas_validas = [linha for linha in linhas if linha.startswith('01')]
+    df = pd.read_fwf(StringIO('\n'.join(linhas_validas)), colspecs=colspecs, names=colnames)
+    df['data_pregao'] = pd.to_datetime(df['data_pregao'], format='%Y%m%d')
+    for col in colnames[5:11]:
+        df[col] = df[col].astype(float) / 100
+    return len(df)
+
+
+def parser_em_lotes(conteudo):
+    return sum(len(df) for df in ler_cotahist_em_lotes(io.BytesIO(conteudo)))
+
+
+conteudo = gerar_cotahist(N_REGISTROS)
+print(f"Arquivo sintético: {N_REGISTROS} registros, {len(conteudo) / 2**20:.1f} MiB")
+
+for nome, funcao in [("read_fwf (antigo)", parser_antigo), ("em lotes (NumPy)", parser_em_lotes)]:
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    registros = funcao(conteudo)
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nome:<20} {duracao:6.2f}s  {registros / duracao:12,.0f} registros/s  pico {pico / 2**20:8.1f} MiB")
@@ -0,0 +1,77 @@
+# Rebuild do historico_operacoes em partições: 1 processo x pool de N processos
+# (backend.historico_operacoes.consolidar_particoes), sobre uma carteira sintética.
+# Como no rebuild real, cada processo carrega a sua própria partição (aqui gerada a partir
+# da lista de ativos, no lugar das consultas ao banco) e só devolve o consolidado.
+# O speedup depende dos núcleos disponíveis: com 1 CPU o pool só acrescenta custo.
+# Uso: python benchmarks/bench_historico_paralelo.py [n_notas] [max_processos]
+import sys
+import os
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.historico_operacoes import consolidar_particoes, particionar
+
+ATIVOS = 1000
+CONTAS = 500
+
+
+def carregar_sintetico(particao, notas_por_ativo):
+    """Notas, proventos e preços dos ativos da `particao`; cada ativo tem a sua semente,
+    então o resultado não depende de como a carteira foi particionada."""
+    notas, prov, ativos_yahoo, preco_inicio = [], [], [], []
+    for codigo in particao:
+        rng = np.random.default_rng(int(codigo[2:6]))
+        n = notas_por_ativo
+        notas.append(pd.DataFrame({
+            'conta': rng.integers(1, CONTAS + 1, n),
+            'cliente': 'cliente',
+            'ativo_base': codigo,
+            'tipo_papel': rng.choice(['ACAO', 'OPCAO'], n),
+            'tipo_lado': rng.choice(['C', 'V'], n),
+            'quantidade': rng.integers(100, 1000, n),
+            'valor_operacao': rng.uniform(100, 10000, n),
+            'data_registro': pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 900, n), unit='D'),
+        }))
+        prov.append(pd.DataFrame({
+            'ativo': codigo,
+            'data_com': pd.Timestamp('2022-03-01') + pd.to_timedelta(rng.integers(0, 900, 4), unit='D'),
+            'valor': rng.uniform(0.1, 2, 4),
+        }))
+        ativos_yahoo.append((codigo, rng.uniform(5, 50)))
+        preco_inicio.append((codigo, rng.uniform(5, 50)))
+    return (
+        pd.concat(notas, ignore_index=True),
+        pd.concat(prov, ignore_index=True),
+        pd.DataFrame(ativos_yahoo, columns=['asset_original', 'preco_atual']),
+        pd.DataFrame(preco_inicio, columns=['ativo_base', 'preco_fechamento_inicio_operacoes']),
+    )
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    max_processos = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    codigos = [f"AT{i:04d}3" for i in range(ATIVOS)]
+    carregar = partial(carregar_sintetico, notas_por_ativo=max(n // ATIVOS, 1))
+    particoes = particionar(codigos, 50)
+    print(f"{n:,} notas, {len(particoes)} partições, os.cpu_count() = {os.cpu_count()}")
+
+    base = referencia = None
+    for processos in range(1, max_processos + 1):
+        inicio = time.perf_counter()
+        resultado = pd.concat(consolidar_particoes(carregar, particoes, processos), ignore_index=True)
+        tempo = time.perf_counter() - inicio
+        resultado = resultado.sort_values(['conta', 'cliente', 'ativo_base'], ignore_index=True)
+        # Mesmo resultado com qualquer número de processos
+        if referencia is None:
+            base, referencia = tempo, resultado
+        else:
+            pd.testing.assert_frame_equal(resultado, referencia)
+        print(f"{processos:>2} processo(s): {tempo:7.2f}s  {len(resultado):,} posições  ({base / tempo:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
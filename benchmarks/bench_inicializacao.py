@@ -0,0 +1,67 @@
+# Tempo de importação na partida do app (cada medição num interpretador novo, como num
+# container recém-criado), na árvore atual: só o necessário para a tela de login x o
+# conjunto que o app.py importava na partida antes do carregamento sob demanda das páginas.
+# A revisão antiga (baee9eb) não serve de referência direta: o backend/importacao.py dela
+# não compila. As medições rodam num diretório temporário com um secrets.toml fictício,
+# para que módulos que chamam conectar() na importação criem o engine (sem conectar).
+# Qualquer falha de importação interrompe o benchmark: módulo que não importa não é medido.
+# Uso: python benchmarks/bench_inicializacao.py [repeticoes]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CENARIOS = {
+    "login (sob demanda)": ["streamlit", "dotenv", "usuarios"],
+    # Importações de nível de módulo do frontend/app.py antes das páginas sob demanda
+    "antes (tudo na partida)": [
+        "streamlit", "pandas", "datetime", "yfinance", "st_aggrid", "bcrypt", "backend.importacao",
+        "usuarios", "paginas.Consulta_de_Premios", "paginas.Ativos_Livres", "paginas.Consulta_de_Notas",
+        "paginas.Posicao_Consolidada", "paginas.Cadastro_de_Usuarios", "paginas.Trocar_Senha",
+        "admin_painel", "paginas.Calculo_Estruturadas", "dotenv",
+    ],
+}
+
+SECRETS = """
+DBUSER = "bench"
+DBPASSWORD = "bench"
+DBHOST = "127.0.0.1"
+DBPORT = 3306
+DBNAME = "bench"
+"""
+
+MEDIR = """
+import sys, time, importlib
+sys.path[:0] = [{raiz!r}, {frontend!r}]
+inicio = time.perf_counter()
+for modulo in {modulos!r}:
+    importlib.import_module(modulo)
+print(time.perf_counter() - inicio)
+"""
+
+
+def medir(modulos, diretorio):
+    codigo = MEDIR.format(raiz=RAIZ, frontend=os.path.join(RAIZ, 'frontend'), modulos=modulos)
+    resultado = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, cwd=diretorio)
+    if resultado.returncode != 0:
+        erro = (resultado.stderr.strip().splitlines() or ["sem saída"])[-1]
+        sys.exit(f"Falha ao importar {modulos}: {erro}")
+    return float(resultado.stdout.strip().splitlines()[-1])
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    with tempfile.TemporaryDirectory() as diretorio:
+        os.makedirs(os.path.join(diretorio, ".streamlit"))
+        with open(os.path.join(diretorio, ".streamlit", "secrets.toml"), "w") as f:
+            f.write(SECRETS)
+        for nome, modulos in CENARIOS.items():
+            tempo = statistics.median(medir(modulos, diretorio) for _ in range(repeticoes))
+            print(f"{nome:<26} {tempo:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Classificação de resultado das opções: apply por linha (antigo) x máscaras NumPy
+# (backend.opcoes.classificar_resultado). Uso: python benchmarks/bench_resultado_opcoes.py
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.opcoes import classificar_resultado
+
+HOJE = pd.Timestamp('2025-06-30')
+
+
+def notas_sinteticas(n, semente=0):
+    rng = np.random.default_rng(semente)
+    preco = rng.uniform(5, 50, n)
+    preco[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'tipo_opcao': rng.choice(['CALL', 'PUT'], n),
+        'vencimento': HOJE + pd.to_timedelta(rng.integers(-400, 120, n), unit='D'),
+        'preco_fechamento': preco,
+        'strike_ajustado': rng.uniform(5, 50, n),
+    })
+
+
+def calcular_resultado(row):
+    vencida = row['vencimento'] < HOJE
+    tipo = row['tipo_opcao']
+    preco = row['preco_fechamento']
+    strike = row['strike_ajustado']
+    if pd.isna(preco) or pd.isna(strike): return None
+
+    if vencida:
+        if tipo == 'CALL':
+            return 'Exercicio' if preco >= strike else 'Virou Pó'
+        elif tipo == 'PUT':
+            return 'Exercicio' if preco <= strike else 'Virou Pó'
+    else:
+        if tipo == 'CALL':
+            return 'Indo a Exercicio' if preco >= strike else 'Virando Pó'
+        elif tipo == 'PUT':
+            return 'Indo a Exercicio' if preco <= strike else 'Virando Pó'
+
+
+for n in (100_000, 1_000_000):
+    df = notas_sinteticas(n)
+
+    t0 = time.perf_counter()
+    novo = classificar_resultado(df, HOJE)
+    t_novo = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    antigo = df.apply(calcular_resultado, axis=1)
+    t_antigo = time.perf_counter() - t0
+
+    iguais = antigo.fillna('-').equals(novo.fillna('-'))
+    print(f"{n:>9,} notas  apply {t_antigo:7.2f}s  vetorizado {t_novo:6.3f}s  "
+          f"({t_antigo / t_novo:,.0f}x)  mesmos resultados: {iguais}")
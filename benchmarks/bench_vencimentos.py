@@ -0,0 +1,48 @@
+# Resolução de vencimentos de opções: filtro por nota (antigo) x merge_asof (backend.vencimentos).
+# Uso: python benchmarks/bench_vencimentos.py [notas]
+import sys
+import os
+import time
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.vencimentos import resolver_vencimentos
+
+N_NOTAS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+AMOSTRA_ANTIGO = 2_000
+
+rng = np.random.default_rng(0)
+letras = list('ABCDEFGHIJKLMNOPQRSTUVWX')
+df_vencimentos = pd.DataFrame(
+    [(letra, dt.date(ano, i % 12 + 1, 15)) for ano in range(2015, 2031) for i, letra in enumerate(letras)],
+    columns=['codigo_letra', 'data_vencimento']
+)
+inicio = dt.date(2015, 1, 1)
+df_notas = pd.DataFrame({
+    'letra_call_put': rng.choice(letras, N_NOTAS),
+    'data_registro': pd.to_datetime(inicio) + pd.to_timedelta(rng.integers(0, 365 * 15, N_NOTAS), unit='D'),
+})
+
+
+def encontrar_vencimento(letra, data_registro):
+    datas_possiveis = df_vencimentos[
+        (df_vencimentos['codigo_letra'] == letra) &
+        (df_vencimentos['data_vencimento'] > data_registro)
+    ].sort_values('data_vencimento')
+    return datas_possiveis.iloc[0]['data_vencimento'] if not datas_possiveis.empty else None
+
+
+amostra = df_notas.head(AMOSTRA_ANTIGO).copy()
+amostra['data_registro'] = amostra['data_registro'].dt.date
+t0 = time.perf_counter()
+amostra.apply(lambda row: encontrar_vencimento(row['letra_call_put'], row['data_registro']), axis=1)
+por_nota = (time.perf_counter() - t0) / AMOSTRA_ANTIGO
+print(f"apply por nota (antigo):  {por_nota * 1e6:8.1f} µs/nota -> ~{por_nota * N_NOTAS:8.1f}s estimados para {N_NOTAS:,} notas")
+
+t0 = time.perf_counter()
+vencimentos = resolver_vencimentos(df_notas, df_vencimentos)
+duracao = time.perf_counter() - t0
+print(f"merge_asof (novo):        {duracao:8.2f}s para {N_NOTAS:,} notas ({vencimentos.notna().sum():,} resolvidas)")
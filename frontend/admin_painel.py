@@ -2,9 +2,10 @@ import streamlit as st
 import tempfile
 import sys
 import os
-from backend.conexao import conectar
+from backend.conexao import conectar, estatisticas_pool
 from backend.importacao import (
     importar_notas_atualizado,
+    enriquecer_notas,
     importar_historico_precos,
     importar_proventos,
     importar_ativos,
@@ -15,6 +16,7 @@ from backend.importacao import (
     atualizar_asset_yahoo,
     importar_ativos_livres,
 )
+from backend.premio_mensal import recalcular_premio_mensal
 
 
 def render():
@@ -76,6 +78,20 @@ def render():
             except Exception as e:
                 st.error(f"Erro ao importar vencimentos: {e}")
 
+        if st.button("Reprocessar campos derivados das notas"):
+            try:
+                classificadas = enriquecer_notas(completo=True)
+                st.success(f"Notas reprocessadas com sucesso ({len(classificadas)} classificadas pela primeira vez).")
+            except Exception as e:
+                st.error(f"Erro ao reprocessar notas: {e}")
+
+        if st.button("Reconstruir resumo de prêmios"):
+            try:
+                recalcular_premio_mensal(engine)
+                st.success("Resumo de prêmios reconstruído com sucesso.")
+            except Exception as e:
+                st.error(f"Erro ao reconstruir resumo de prêmios: {e}")
+
         if st.button("Atualizar Ativos com código .SA"):
             try:
                 atualizar_asset_yahoo()
@@ -84,10 +100,11 @@ def render():
                 st.error(f"Erro ao atualizar ativos: {e}")
 
     st.subheader("📈 Atualizar Histórico de Operações")
+    completo = st.checkbox("Reconstrução completa (recalcula todas as posições)")
     if st.button("Atualizar histórico"):
         try:
-            atualizar_historico_operacoes()
-            st.success("✅ Histórico atualizado com sucesso!")
+            total = atualizar_historico_operacoes(completo=completo)
+            st.success(f"✅ Histórico atualizado com sucesso! {total} posições recalculadas.")
         except Exception as e:
             st.error(f"❌ Erro ao atualizar: {e}")
 
@@ -115,3 +132,6 @@ def render():
             importar_ativos_livres(arquivo_livres, engine)
         else:
             st.warning("Por favor, selecione um arquivo antes de importar.")
+
+    with st.expander("🔌 Conexões com o banco"):
+        st.json(estatisticas_pool())
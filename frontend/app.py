@@ -1,44 +1,35 @@
 import streamlit as st
-import pandas as pd
-from datetime import date
-import yfinance as yf
-from st_aggrid import AgGrid, GridOptionsBuilder
-import bcrypt
+import importlib
 import sys
 import os
 
 # adiciona a raiz do projeto ao sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-
-from backend.importacao import (
-    importar_notas_atualizado,
-    importar_historico_precos,
-    importar_proventos,
-    importar_ativos,
-    calcular_resultado_opcoes,
-    importar_vencimentos_opcoes,
-    atualizar_historico_operacoes,
-    obter_lista_assets,
-    obter_preco_ultimo,
-    atualizar_preco,
-    importar_ativos_yahoo,
-    atualizar_asset_yahoo,
-    importar_ativos_livres,
-)
-
 from usuarios import autenticar_usuario
-from paginas.Consulta_de_Premios import render as render_premios
-from paginas.Ativos_Livres import render as render_ativos
-from paginas.Consulta_de_Notas import render as render_consulta
-from paginas.Posicao_Consolidada import render as render_posicao
-from paginas.Cadastro_de_Usuarios import render as render_cadastro_usuario
-from paginas.Trocar_Senha import render_trocar_senha
-from admin_painel import render as render_admin
-from paginas.Calculo_Estruturadas import render as render_estrutura
 from dotenv import load_dotenv
 load_dotenv()
 
+# Páginas do menu -> (módulo, função de renderização).
+# O módulo só é importado quando a página é aberta, então a tela de login não
+# paga pelo carregamento de pandas, AgGrid, yfinance e afins de todas as páginas.
+PAGINAS = {
+    "Consulta de Prêmios": ("paginas.Consulta_de_Premios", "render"),
+    "Ativos Livres": ("paginas.Ativos_Livres", "render"),
+    "Importações e Atualizações": ("admin_painel", "render"),
+    "Consulta de Notas": ("paginas.Consulta_de_Notas", "render"),
+    "Consulta Posição": ("paginas.Posicao_Consolidada", "render"),
+    "Cálculo Estruturadas": ("paginas.Calculo_Estruturadas", "render"),
+    "Cadastro de Usuários": ("paginas.Cadastro_de_Usuarios", "render"),
+    "Trocar Senha": ("paginas.Trocar_Senha", "render_trocar_senha"),
+}
+PAGINAS_ADMIN = {"Importações e Atualizações", "Cadastro de Usuários"}
+
+
+def carregar_pagina(nome):
+    modulo, funcao = PAGINAS[nome]
+    return getattr(importlib.import_module(modulo), funcao)
+
 
 
 # Configuração da página
@@ -104,29 +95,8 @@ else:
         st.title("📊 Sistema Estruturadas")
         st.success("Bem-vindo ao painel principal. Navegue pelo menu no canto esquerdo")
 
-    elif pagina == "Consulta de Prêmios":
-        render_premios()
-
-    elif pagina == "Ativos Livres":
-        render_ativos()
-
-    elif pagina == "Importações e Atualizações" and usuario["perfil"] == "admin":
-        render_admin()
-
-    elif pagina == "Consulta de Notas":
-        render_consulta()
-
-    elif pagina == "Consulta Posição":
-        render_posicao()
-
-    elif pagina == "Cálculo Estruturadas":
-        render_estrutura()
-        
-    elif pagina == "Cadastro de Usuários" and usuario["perfil"] == "admin":
-        render_cadastro_usuario()
-        
-    elif pagina == "Trocar Senha":
-        render_trocar_senha()
+    elif pagina in PAGINAS and (pagina not in PAGINAS_ADMIN or usuario["perfil"] == "admin"):
+        carregar_pagina(pagina)()
 
 
 
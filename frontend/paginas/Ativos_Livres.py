@@ -1,13 +1,14 @@
 import streamlit as st
-import pandas as pd
 from backend.importacao import (
-    importar_ativos_livres,
     atualizar_preco_atual_ativos_livres,
     obter_lista_assets,
-    obter_preco_ultimo,
-    atualizar_preco,
     engine
 )
+from backend.cache_cotacoes import obter_cache_cotacoes
+from backend.cache_consultas import valores_distintos
+from backend.ativos_livres import COLUNAS_EXIBIR, consultar_ativos_livres, resumir_ativos_livres
+
+TAMANHO_PAGINA = 100
 
 def render():
     # 🔒 Verifica se o usuário está logado e tem perfil permitido
@@ -28,41 +29,42 @@ def render():
     # 🔄 Botão para atualizar preços na tabela ativos_yahoo
     if st.button("🔄 Atualizar todos os preços"):
         df_assets = obter_lista_assets(engine)
-        atualizados = 0
-        falhas = []
 
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        for i, row in df_assets.iterrows():
-            ticker_yahoo = row['asset_original'].strip().upper() + ".SA"
-            status_text.text(f"🔍 Atualizando {row['asset_original']}...")
-            preco = obter_preco_ultimo(ticker_yahoo)
-
-            if preco is not None:
-                atualizar_preco(engine, row['asset_original'], preco)
-                atualizados += 1
-            else:
-                falhas.append(row['asset_original'])
-
-            progress_bar.progress((i + 1) / len(df_assets))
-
-        st.success(f"✅ {atualizados} ativos atualizados com sucesso.")
+        def ao_progredir(concluidos, total):
+            status_text.text(f"🔍 {concluidos} de {total} ativos consultados...")
+            progress_bar.progress(concluidos / total)
+
+        # Preços ainda no TTL não vão ao Yahoo; os vencidos são revalidados em segundo plano
+        cache = obter_cache_cotacoes(engine)
+        resultado, origens = cache.obter_varios_com_origem(df_assets['asset_original'].tolist(), ao_progredir=ao_progredir)
+        progress_bar.progress(1.0)
+        consultados = sum(origem == 'consultado' for origem in origens.values())
+        do_cache = sum(origem in ('cache', 'vencido') for origem in origens.values())
+        vencidos = sum(origem == 'vencido' for origem in origens.values())
+        falhas = [asset for asset, preco in resultado.items() if preco is None]
+
+        st.success(f"✅ {consultados} ativos com preço consultado agora.")
+        if do_cache:
+            st.info(f"ℹ️ {do_cache} ativos servidos do cache ({vencidos} vencidos, revalidando em segundo plano).")
+        st.caption(f"Cache de cotações: {cache.estatisticas()}")
         if falhas:
             st.warning(f"⚠️ Falha ao atualizar os seguintes ativos: {', '.join(falhas)}")
 
     # 🧪 Botão de teste para atualizar ativos_livres diretamente
     if st.button("🧪 Testar atualização de preços em ativos_livres"):
-        atualizar_preco_atual_ativos_livres()
+        atualizar_preco_atual_ativos_livres(forcar=True)
+        st.success("Preço atual, rentabilidade e volume livre recalculados.")
 
     # 🔍 Filtros de Identificação
     st.markdown("### 🔍 Filtros de Identificação")
-    df_base = pd.read_sql("SELECT * FROM ativos_livres", con=engine)
     col1, col2, col3, col4 = st.columns(4)
     cliente_busca = col1.text_input("Buscar Cliente")
-    ativo_sel = col2.selectbox("Ativo", ["Todos"] + sorted(df_base['Ativo'].dropna().unique()))
+    ativo_sel = col2.selectbox("Ativo", ["Todos"] + valores_distintos('ativos_livres', 'Ativo'))
     assessor_sel = col3.text_input("Buscar por Assessor")
-    mesa_sel = col4.selectbox("Mesa", ["Todos"] + sorted(df_base['Mesa'].dropna().unique()))
+    mesa_sel = col4.selectbox("Mesa", ["Todos"] + valores_distintos('ativos_livres', 'Mesa'))
 
     st.markdown("---")
 
@@ -74,62 +76,63 @@ def render():
 
     # 🎯 Botão para aplicar filtro
     if st.button("Aplicar filtro"):
+        # Só recalcula se os preços ou a carteira mudaram desde a última vez
         atualizar_preco_atual_ativos_livres()
-        df = pd.read_sql("SELECT * FROM ativos_livres", con=engine)
-
-        if df.empty:
-            st.warning("Nenhum dado encontrado.")
-            return
-
-        df_filtrado = df.copy()
-        if cliente_busca:
-            df_filtrado = df_filtrado[df_filtrado['Cliente'].str.contains(cliente_busca, case=False, na=False)]
-        if ativo_sel != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['Ativo'] == ativo_sel]
-        if assessor_sel:
-            df_filtrado = df_filtrado[df_filtrado['Assessor'].str.contains(assessor_sel, case=False, na=False)]
-        if mesa_sel != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['Mesa'] == mesa_sel]
-        df_filtrado = df_filtrado[df_filtrado['Qtde_Livre'].fillna(0) > qtde_minima]
-        df_filtrado = df_filtrado[df_filtrado['Volume_Livre'].fillna(0) > volume_minimo]
-
-        volume_total = df_filtrado['Volume_Livre'].sum(skipna=True)
-        st.metric(label="💰 Volume Livre Total (filtrado)", value=f"R$ {volume_total:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
-
-        df_filtrado = df_filtrado.sort_values(by='Volume_Livre', ascending=False, na_position='last')
-
-        def format_brl(x):
-            return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-        def format_pct(x):
-            return f"{x:.2f} %".replace(".", ",")
-
-        df_formatado = df_filtrado.copy()
-        df_formatado['Preco_Medio'] = df_formatado['Preco_Medio'].apply(format_brl)
-        df_formatado['Preco_Atual'] = df_formatado['Preco_Atual'].apply(format_brl)
-        df_formatado['Volume_Livre'] = df_formatado['Volume_Livre'].apply(format_brl)
-        df_formatado['Rentabilidade'] = df_formatado['Rentabilidade'].apply(format_pct)
-
-        colunas_exibir = ['Conta', 'Cliente', 'Ativo', 'Assessor', 'Qtde_Total', 'Qtde_Livre',
-                          'Preco_Medio', 'Preco_Atual', 'Volume_Livre', 'Rentabilidade']
-
-        nomes_personalizados = {
-            'Conta': 'Conta',
-            'Cliente': 'Cliente',
-            'Ativo': 'Ativo',
-            'Assessor': 'Assessor',
-            'Qtde_Total': 'Quantidade Total',
-            'Qtde_Livre': 'Quantidade Livre',
-            'Preco_Medio': 'Preço Médio',
-            'Preco_Atual': 'Preço Atual',
-            'Volume_Livre': 'Volume Livre',
-            'Rentabilidade': 'Rentabilidade'
+        st.session_state.filtros_ativos_livres = {
+            "cliente": cliente_busca,
+            "ativo": None if ativo_sel == "Todos" else ativo_sel,
+            "assessor": assessor_sel,
+            "mesa": None if mesa_sel == "Todos" else mesa_sel,
+            "qtde_minima": qtde_minima,
+            "volume_minimo": volume_minimo,
         }
 
-        df_final = df_formatado[colunas_exibir].rename(columns=nomes_personalizados)
+    # Os filtros ficam na sessão para a troca de página não exigir novo clique
+    filtros = st.session_state.get("filtros_ativos_livres")
+    if filtros is None:
+        return
+
+    # Filtro, ordenação, total e paginação rodam no banco: só a página exibida é trafegada
+    total_linhas, volume_total = resumir_ativos_livres(engine, **filtros)
+    if total_linhas == 0:
+        st.warning("Nenhum dado encontrado.")
+        return
+
+    def format_brl(x):
+        return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    def format_pct(x):
+        return f"{x:.2f} %".replace(".", ",")
+
+    st.metric(label="💰 Volume Livre Total (filtrado)", value=format_brl(volume_total))
+
+    total_paginas = -(-total_linhas // TAMANHO_PAGINA)
+    pagina = st.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+    df_formatado = consultar_ativos_livres(engine, pagina=pagina, tamanho_pagina=TAMANHO_PAGINA, **filtros)
+
+    df_formatado['Preco_Medio'] = df_formatado['Preco_Medio'].apply(format_brl)
+    df_formatado['Preco_Atual'] = df_formatado['Preco_Atual'].apply(format_brl)
+    df_formatado['Volume_Livre'] = df_formatado['Volume_Livre'].apply(format_brl)
+    df_formatado['Rentabilidade'] = df_formatado['Rentabilidade'].apply(format_pct)
+
+    nomes_personalizados = {
+        'Conta': 'Conta',
+        'Cliente': 'Cliente',
+        'Ativo': 'Ativo',
+        'Assessor': 'Assessor',
+        'Qtde_Total': 'Quantidade Total',
+        'Qtde_Livre': 'Quantidade Livre',
+        'Preco_Medio': 'Preço Médio',
+        'Preco_Atual': 'Preço Atual',
+        'Volume_Livre': 'Volume Livre',
+        'Rentabilidade': 'Rentabilidade'
+    }
+
+    df_final = df_formatado[COLUNAS_EXIBIR].rename(columns=nomes_personalizados)
 
-        st.markdown("---")
-        st.subheader("📋 Tabela de Ativos Formatada")
-        st.dataframe(df_final, use_container_width=True)
+    st.markdown("---")
+    st.subheader("📋 Tabela de Ativos Formatada")
+    st.dataframe(df_final, use_container_width=True)
 
-        st.caption(f"🔎 {len(df_final)} ativos encontrados com os filtros aplicados.")
+    st.caption(f"🔎 {total_linhas} ativos encontrados com os filtros aplicados "
+               f"(página {pagina} de {total_paginas}).")
@@ -1,10 +1,29 @@
+import hashlib
+import io
+
+import numpy as np
 import streamlit as st
 import pandas as pd
+from backend.cache_consultas import consulta_versionada, versoes
 from backend.conexao import conectar
 
+COLUNAS_NUMERICAS = [
+    'Valor Ativo', 'Custo Unitário Cliente', 'Comissão Assessor',
+    'Quantidade Ativa (1)', 'Quantidade Boleta (1)', '% do Strike (1)', 'Valor do Strike (1)',
+    '% da Barreira (1)', 'Valor da Barreira (1)', 'Valor do Rebate (1)',
+    'Quantidade Ativa (2)', 'Quantidade Boleta (2)', '% do Strike (2)', 'Valor do Strike (2)',
+    '% da Barreira (2)', 'Valor da Barreira (2)', 'Valor do Rebate (2)',
+    'Quantidade Ativa (3)', 'Quantidade Boleta (3)', '% do Strike (3)', 'Valor do Strike (3)',
+    '% da Barreira (3)', 'Valor da Barreira (3)', 'Valor do Rebate (3)',
+    'Quantidade Ativa (4)', 'Quantidade Boleta (4)', '% do Strike (4)', 'Valor do Strike (4)',
+    '% da Barreira (4)', 'Valor da Barreira (4)', 'Valor do Rebate (4)'
+]
+
 def converter_virgula_para_float(df, colunas):
-    for col in colunas:
-        df[col] = df[col].astype(str).str.replace('.', '').str.replace(',', '.').astype(float)
+    # "1.234,56" -> 1234.56, todas as colunas de uma vez
+    df[colunas] = (
+        df[colunas].replace(r'\.', '', regex=True).replace(',', '.', regex=True).astype(float)
+    )
     return df
 
 def identificar_opcao(df, seq=1):
@@ -18,16 +37,17 @@ def identificar_opcao(df, seq=1):
     df[f'strike_{seq}'] = df[strike_col]
     return df
 
-def tratar_quantidade(row):
-    if row['Quantidade Ativa (1)'] != 0:
-        return abs(row['Quantidade Ativa (1)'])
+def tratar_quantidade(df):
+    """Quantidade da perna 1 ou, se zerada, da primeira perna comprada em ação ('Stock')."""
+    condicoes = [df['Quantidade Ativa (1)'] != 0]
+    valores = [df['Quantidade Ativa (1)'].abs()]
     for i in range(1, 5):
         qt_col = f'Quantidade Ativa ({i})'
         tipo_col = f'Tipo ({i})'
-        if qt_col in row and tipo_col in row:
-            if row[qt_col] > 0 and str(row[tipo_col]).strip().lower() == 'stock':
-                return abs(row[qt_col])
-    return 0
+        if qt_col in df.columns and tipo_col in df.columns:
+            condicoes.append((df[qt_col] > 0) & (df[tipo_col].astype(str).str.strip().str.lower() == 'stock'))
+            valores.append(df[qt_col].abs())
+    return np.select(condicoes, valores, default=0)
 
 def calcular_financiamento(df, precos_ativos):
     df = df.copy()
@@ -55,42 +75,41 @@ def calcular_financiamento(df, precos_ativos):
     df['Cupons/Premio'] = cupons_premio
     return df
 
-def render():
-    st.title("Cálculo de Resultados das Operações Estruturadas")
+@st.cache_data(show_spinner="Processando relatório...", max_entries=8)
+def preparar_relatorio(hash_arquivo, versao_precos, _conteudo):
+    """Relatório lido e calculado, reaproveitado enquanto o arquivo e os preços forem os mesmos.
 
-    engine = conectar()
+    Só `hash_arquivo` (sha256 do upload) e `versao_precos` (versão de ativos_yahoo)
+    entram na chave do cache; o conteúdo em si não é re-hasheado a cada rerun.
+    """
+    df = pd.read_excel(io.BytesIO(_conteudo), dtype=str)
+    df = converter_virgula_para_float(df, COLUNAS_NUMERICAS)
 
-    arquivo = st.file_uploader("📥 Selecione o arquivo Relatório de Posição (1) (.xlsx)", type=["xlsx"])
-    if arquivo:
-        df = pd.read_excel(arquivo, dtype=str)
-
-        colunas_numericas = [
-            'Valor Ativo', 'Custo Unitário Cliente', 'Comissão Assessor',
-            'Quantidade Ativa (1)', 'Quantidade Boleta (1)', '% do Strike (1)', 'Valor do Strike (1)',
-            '% da Barreira (1)', 'Valor da Barreira (1)', 'Valor do Rebate (1)',
-            'Quantidade Ativa (2)', 'Quantidade Boleta (2)', '% do Strike (2)', 'Valor do Strike (2)',
-            '% da Barreira (2)', 'Valor da Barreira (2)', 'Valor do Rebate (2)',
-            'Quantidade Ativa (3)', 'Quantidade Boleta (3)', '% do Strike (3)', 'Valor do Strike (3)',
-            '% da Barreira (3)', 'Valor da Barreira (3)', 'Valor do Rebate (3)',
-            'Quantidade Ativa (4)', 'Quantidade Boleta (4)', '% do Strike (4)', 'Valor do Strike (4)',
-            '% da Barreira (4)', 'Valor da Barreira (4)', 'Valor do Rebate (4)'
-        ]
-        df = converter_virgula_para_float(df, colunas_numericas)
+    df['Data Registro'] = pd.to_datetime(df['Data Registro'], dayfirst=True, errors='coerce')
+    df['Data Vencimento'] = pd.to_datetime(df['Data Vencimento'], dayfirst=True, errors='coerce')
 
-        df['Data Registro'] = pd.to_datetime(df['Data Registro'], dayfirst=True, errors='coerce')
-        df['Data Vencimento'] = pd.to_datetime(df['Data Vencimento'], dayfirst=True, errors='coerce')
+    df['Quantidade'] = tratar_quantidade(df)
 
-        df['Quantidade'] = df.apply(tratar_quantidade, axis=1)
+    for i in range(1, 5):
+        df = identificar_opcao(df, i)
+
+    # Buscar preços atuais da tabela ativos_yahoo
+    precos_df = consulta_versionada("SELECT asset_original, preco_atual FROM ativos_yahoo", ['ativos_yahoo'])
+    precos_ativos = dict(zip(precos_df['asset_original'], precos_df['preco_atual']))
 
-        for i in range(1, 5):
-            df = identificar_opcao(df, i)
+    # Calcular financiamento
+    return calcular_financiamento(df, precos_ativos)
 
-        # Buscar preços atuais da tabela ativos_yahoo
-        precos_df = pd.read_sql("SELECT asset_original, preco_atual FROM ativos_yahoo", engine)
-        precos_ativos = dict(zip(precos_df['asset_original'], precos_df['preco_atual']))
 
-        # Calcular financiamento
-        df = calcular_financiamento(df, precos_ativos)
+def render():
+    st.title("Cálculo de Resultados das Operações Estruturadas")
+
+    arquivo = st.file_uploader("📥 Selecione o arquivo Relatório de Posição (1) (.xlsx)", type=["xlsx"])
+    if arquivo:
+        conteudo = arquivo.getvalue()
+        hash_arquivo = hashlib.sha256(conteudo).hexdigest()
+        versao_precos = versoes(conectar(), ['ativos_yahoo'])[0]
+        df = preparar_relatorio(hash_arquivo, versao_precos, conteudo)
 
         # Filtros simples
         filtro_cliente = st.multiselect('Cliente', df['Código do Cliente'].unique())
@@ -1,7 +1,9 @@
 import streamlit as st
-import pandas as pd
 from frontend.auth import require_usuario
 from backend.importacao import engine
+from backend.consulta_notas import contar_notas, pagina_notas
+
+TAMANHO_PAGINA = 100
 
 def render():
     require_usuario()
@@ -27,65 +29,62 @@ def render():
     tipo_papel = st.selectbox("Tipo de Papel:", ["Todos", "AÇÃO", "OPCAO"])
 
     if st.button("🔍 Consultar Notas"):
-        query = '''
-        SELECT 
-            data_registro, conta, cliente, q_negociacao, tipo_lado, tipo_mercado, ativo_base, quantidade, preco, valor_operacao,
-            debito_credito, tipo_papel, tipo_opcao
-        FROM notas
-        WHERE 1=1
-        '''
-        params = []
-
-        if cliente_input.strip():
-            query += " AND cliente LIKE %s"
-            params.append(f"%{cliente_input.strip()}%")
-
-        if ativo_input.strip():
-            query += " AND ativo_base LIKE %s"
-            params.append(f"%{ativo_input.strip()}%")
-
-        if data_inicio:
-            query += " AND data_registro >= %s"
-            params.append(data_inicio)
-
-        if data_fim:
-            query += " AND data_registro <= %s"
-            params.append(data_fim)
-
-        if tipo_papel != "Todos":
-            query += " AND tipo_papel = %s"
-            params.append(tipo_papel)
-
-        query += " ORDER BY data_registro DESC"
-
-        try:
-            df_notas = pd.read_sql(query, engine, params=tuple(params))
-
-            if df_notas.empty:
-                st.warning("Nenhuma nota encontrada com os filtros selecionados.")
-            else:
-                colunas_moeda = ['preco','valor_operacao']
-                for coluna in colunas_moeda:
-                    df_notas[coluna] = pd.to_numeric(df_notas[coluna], errors='coerce')
-                    df_notas[coluna] = df_notas[coluna].apply(lambda x: f"R$ {x:,.2f}" if pd.notnull(x) else "R$ 0,00")
-
-                df_notas = df_notas.rename(columns={
-                    "data_registro": "Data do Pregão",
-                    "conta" : "Conta",
-                    "cliente" : "Cliente",
-                    "q_negociacao": "Negociação",
-                    "tipo_lado": "C/V",
-                    "tipo_mercado": "Tipo Mercado",
-                    "ativo_base": "Ativo",
-                    "quantidade": "Quantidade",
-                    "preco": "Preço/Ajuste",
-                    "valor_operacao": "Valor Operação/Ajuste",
-                    "debito_credito": "D/C",
-                    "tipo_papel": "Tipo Papel",
-                    "tipo_opcao": "Tipo Opção"
-                })
-
-                st.dataframe(df_notas, use_container_width=True)
-                st.success(f"{len(df_notas)} notas encontradas.")
-        except Exception as e:
-            st.error(f"Erro ao consultar notas: {e}")
+        st.session_state.filtros_notas = {
+            "cliente": cliente_input.strip(),
+            "ativo": ativo_input.strip(),
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "tipo_papel": None if tipo_papel == "Todos" else tipo_papel,
+        }
+        # Pilha de cursores: o topo é o início da página exibida
+        st.session_state.cursores_notas = [None]
+
+    filtros = st.session_state.get("filtros_notas")
+    if filtros is None:
+        return
+
+    try:
+        cursores = st.session_state.cursores_notas
+        total = contar_notas(engine, **filtros)
+        df_notas, proximo = pagina_notas(engine, cursor=cursores[-1], tamanho_pagina=TAMANHO_PAGINA, **filtros)
+
+        if df_notas.empty:
+            st.warning("Nenhuma nota encontrada com os filtros selecionados.")
+            return
+
+        # Valores continuam numéricos: a formatação é feita pelo st.dataframe na exibição
+        st.dataframe(
+            df_notas,
+            use_container_width=True,
+            hide_index=True,
+            column_order=[c for c in df_notas.columns if c != 'id'],
+            column_config={
+                "data_registro": st.column_config.DateColumn("Data do Pregão", format="DD/MM/YYYY"),
+                "conta": st.column_config.NumberColumn("Conta", format="%d"),
+                "cliente": "Cliente",
+                "q_negociacao": "Negociação",
+                "tipo_lado": "C/V",
+                "tipo_mercado": "Tipo Mercado",
+                "ativo_base": "Ativo",
+                "quantidade": st.column_config.NumberColumn("Quantidade"),
+                "preco": st.column_config.NumberColumn("Preço/Ajuste", format="R$ %.2f"),
+                "valor_operacao": st.column_config.NumberColumn("Valor Operação/Ajuste", format="R$ %.2f"),
+                "debito_credito": "D/C",
+                "tipo_papel": "Tipo Papel",
+                "tipo_opcao": "Tipo Opção",
+            },
+        )
+
+        pagina = len(cursores)
+        inicio = (pagina - 1) * TAMANHO_PAGINA
+        st.success(f"{total} notas encontradas (exibindo {inicio + 1} a {inicio + len(df_notas)}).")
+
+        col_anterior, col_proxima = st.columns(2)
+        if col_anterior.button("⬅️ Anterior", disabled=pagina == 1):
+            cursores.pop()
+            st.rerun()
+        if col_proxima.button("Próxima ➡️", disabled=proximo is None):
+            cursores.append(proximo)
+            st.rerun()
+    except Exception as e:
+        st.error(f"Erro ao consultar notas: {e}")
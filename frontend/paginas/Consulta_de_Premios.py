@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from backend.importacao import engine, consolidar_notas_simples, obter_lista_assets, obter_preco_ultimo, atualizar_preco
+from backend.importacao import engine, consolidar_notas_simples
+from backend.cache_consultas import anos_com_notas, valores_distintos
 from frontend.auth import require_usuario
 
 def render():
@@ -17,26 +18,23 @@ def render():
 
     if st.button("🔄 Atualizar todos os preços"):
         df_assets = obter_lista_assets(engine)
-        atualizados = 0
-        falhas = []
 
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        for i, row in df_assets.iterrows():
-            ticker_yahoo = row['asset_original'].strip().upper() + ".SA"
-            status_text.text(f"🔍 Atualizando {row['asset_original']}...")
-            preco = obter_preco_ultimo(ticker_yahoo)
+        def ao_progredir(concluidos, total):
+            status_text.text(f"🔍 {concluidos} de {total} ativos consultados...")
+            progress_bar.progress(concluidos / total)
 
-            if preco is not None:
-                atualizar_preco(engine, row['asset_original'], preco)
-                atualizados += 1
-            else:
-                falhas.append(row['asset_original'])
-
-            progress_bar.progress((i + 1) / len(df_assets))
+        # Preços ainda no TTL não vão ao Yahoo; os vencidos são revalidados em segundo plano
+        cache = obter_cache_cotacoes(engine)
+        resultado = cache.obter_varios(df_assets['asset_original'].tolist(), ao_progredir=ao_progredir)
+        progress_bar.progress(1.0)
+        atualizados = sum(preco is not None for preco in resultado.values())
+        falhas = [asset for asset, preco in resultado.items() if preco is None]
 
-        st.success(f"✅ {atualizados} ativos atualizados com sucesso.")
+        st.success(f"✅ {atualizados} ativos com preço atualizado.")
+        st.caption(f"Cache de cotações: {cache.estatisticas()}")
         if falhas:
             st.warning(f"⚠️ Falha ao atualizar os seguintes ativos: {', '.join(falhas)}")"""
 
@@ -52,15 +50,11 @@ def render():
         cliente_input = st.text_input("Digite o nome do cliente:")
 
     with col2:
-        ativos = pd.read_sql("SELECT DISTINCT ativo_base FROM notas", engine)
-        ativo_selecionado = st.selectbox("Selecione o ativo (opcional):", ["Todos"] + ativos['ativo_base'].tolist())
+        ativos = valores_distintos('notas', 'ativo_base')
+        ativo_selecionado = st.selectbox("Selecione o ativo (opcional):", ["Todos"] + ativos)
 
     with col3:
-        anos_disponiveis = pd.read_sql(
-            "SELECT DISTINCT YEAR(data_registro) AS ano FROM notas ORDER BY ano DESC",
-            engine
-        )
-        ano_selecionado = st.selectbox("Selecione o ano:", anos_disponiveis['ano'].tolist())
+        ano_selecionado = st.selectbox("Selecione o ano:", anos_com_notas())
 
     with col4:
         data_inicio = pd.to_datetime(st.date_input("Data inicial"))
@@ -76,19 +70,16 @@ def render():
 
     if st.button("Filtrar Operações"):
         try:
-            df_consulta = consolidar_notas_simples(data_inicio, data_fim, engine)
-
-            # Filtros adicionais
-            if cliente_input.strip():
-                df_consulta = df_consulta[df_consulta['cliente'].str.contains(cliente_input.strip(), case=False)]
-
-            if ativo_selecionado != "Todos":
-                df_consulta = df_consulta[df_consulta['ativo_base'] == ativo_selecionado]
-
-            if tipo_posicao == "Ativas (quantidade > 0)":
-                df_consulta = df_consulta[df_consulta['quantidade_atual'] > 0]
-            elif tipo_posicao == "Zeradas (quantidade <= 0)":
-                df_consulta = df_consulta[df_consulta['quantidade_atual'] <= 0]
+            # Filtros aplicados no próprio banco, junto com a agregação
+            df_consulta = consolidar_notas_simples(
+                data_inicio, data_fim, engine,
+                cliente=cliente_input.strip(),
+                ativo=None if ativo_selecionado == "Todos" else ativo_selecionado,
+                tipo_posicao={
+                    "Ativas (quantidade > 0)": "ativas",
+                    "Zeradas (quantidade <= 0)": "zeradas",
+                }.get(tipo_posicao),
+            )
 
             if not df_consulta.empty:
                 soma_premio = df_consulta['Premio_liquido'].sum()
@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
-from backend.importacao import engine, obter_lista_assets, obter_preco_ultimo, atualizar_preco
+from backend.importacao import engine, obter_lista_assets
+from backend.cache_cotacoes import obter_cache_cotacoes
+from backend.cache_consultas import anos_com_notas, valores_distintos
+from backend.premio_mensal import consultar_premio_mensal, consultar_premio_todos_anos
 from frontend.auth import require_usuario
 
 
@@ -18,31 +21,31 @@ def render():
 
     if st.button("🔄 Atualizar todos os preços"):
         df_assets = obter_lista_assets(engine)
-        atualizados = 0
-        falhas = []
 
 
         progress_bar = st.progress(0)
         status_text = st.empty()
 
 
-        for i, row in df_assets.iterrows():
-            ticker_yahoo = row['asset_original'].strip().upper() + ".SA"
-            status_text.text(f"🔍 Atualizando {row['asset_original']}...")
-            preco = obter_preco_ultimo(ticker_yahoo)
+        def ao_progredir(concluidos, total):
+            status_text.text(f"🔍 {concluidos} de {total} ativos consultados...")
+            progress_bar.progress(concluidos / total)
 
 
-            if preco is not None:
-                atualizar_preco(engine, row['asset_original'], preco)
-                atualizados += 1
-            else:
-                falhas.append(row['asset_original'])
-
-
-            progress_bar.progress((i + 1) / len(df_assets))
+        # Preços ainda no TTL não vão ao Yahoo; os vencidos são revalidados em segundo plano
+        cache = obter_cache_cotacoes(engine)
+        resultado, origens = cache.obter_varios_com_origem(df_assets['asset_original'].tolist(), ao_progredir=ao_progredir)
+        progress_bar.progress(1.0)
+        consultados = sum(origem == 'consultado' for origem in origens.values())
+        do_cache = sum(origem in ('cache', 'vencido') for origem in origens.values())
+        vencidos = sum(origem == 'vencido' for origem in origens.values())
+        falhas = [asset for asset, preco in resultado.items() if preco is None]
 
 
-        st.success(f"✅ {atualizados} ativos atualizados com sucesso.")
+        st.success(f"✅ {consultados} ativos com preço consultado agora.")
+        if do_cache:
+            st.info(f"ℹ️ {do_cache} ativos servidos do cache ({vencidos} vencidos, revalidando em segundo plano).")
+        st.caption(f"Cache de cotações: {cache.estatisticas()}")
         if falhas:
             st.warning(f"⚠️ Falha ao atualizar os seguintes ativos: {', '.join(falhas)}")
 
@@ -63,20 +66,17 @@ def render():
 
     with col2:
         try:
-            ativos = pd.read_sql("SELECT DISTINCT ativo_base FROM historico_operacoes", engine)
-            ativo_selecionado = st.selectbox("Selecione o ativo (opcional):", ["Todos"] + ativos['ativo_base'].tolist())
+            ativos = valores_distintos('historico_operacoes', 'ativo_base')
+            ativo_selecionado = st.selectbox("Selecione o ativo (opcional):", ["Todos"] + ativos)
         except Exception:
             ativo_selecionado = "Todos"
 
 
-        anos_disponiveis = pd.read_sql(
-            "SELECT DISTINCT YEAR(data_registro) AS ano FROM notas ORDER BY ano DESC",
-            engine
-        )
+        anos_disponiveis = anos_com_notas()
 
 
     with col3:
-        ano_selecionado = st.selectbox("Selecione o ano:", anos_disponiveis['ano'].tolist())
+        ano_selecionado = st.selectbox("Selecione o ano:", anos_disponiveis)
 
 
     with col4:
@@ -190,34 +190,8 @@ def render():
             st.title("Prêmio Mensal")
 
 
-            query_resumo = """
-            SELECT 
-                cliente,
-                MONTH(data_registro) AS mes,
-                SUM(
-                    CASE 
-                        WHEN tipo_lado = 'V' THEN valor_operacao
-                        WHEN tipo_lado = 'C' THEN -valor_operacao
-                        ELSE 0
-                    END
-                ) AS premio_total
-            FROM notas
-            WHERE 
-                YEAR(data_registro) = %s
-                AND tipo_papel = 'OPCAO'
-            """
-            params_resumo = [ano_selecionado]
-
-
-            if cliente_input.strip() != "":
-                query_resumo += " AND cliente LIKE %s"
-                params_resumo.append(f"%{cliente_input.strip()}%")
-
-
-            query_resumo += " GROUP BY cliente, mes ORDER BY cliente, mes"
-
-
-            df_resumo = pd.read_sql(query_resumo, engine, params=tuple(params_resumo))
+            # Lido do resumo premio_mensal, mantido a cada importação de notas
+            df_resumo = consultar_premio_mensal(engine, ano=ano_selecionado, cliente=cliente_input.strip())
 
 
             mes_abreviado = {
@@ -239,5 +213,15 @@ def render():
             st.dataframe(df_pivot_formatado)
 
 
+            # Tendência de todos os anos, também direto do resumo
+            df_tendencia = consultar_premio_todos_anos(engine, cliente=cliente_input.strip())
+            if not df_tendencia.empty:
+                df_tendencia['periodo'] = pd.to_datetime(
+                    pd.DataFrame({'year': df_tendencia['ano'], 'month': df_tendencia['mes'], 'day': 1})
+                )
+                st.subheader("Prêmio Líquido Mensal - Todos os Anos")
+                st.line_chart(df_tendencia.groupby('periodo')['premio_total'].sum())
+
+
         except Exception as e:
             st.error(f"❌ Erro ao consultar: {e}")
@@ -1,19 +1,9 @@
-import pandas as pd
-import numpy as np
-import re
-import sys
-import os
-import yfinance as yf
-from datetime import datetime
-from datetime import date
 from sqlalchemy import text
-from io import StringIO
 import bcrypt
 from backend.conexao import conectar
 
-engine = conectar()  # cria a conexão uma vez
-
 def usuario_existe(username):
+    engine = conectar()
     query = text("SELECT COUNT(*) FROM usuarios WHERE username = :username")
     with engine.connect() as conn:
         result = conn.execute(query, {"username": username}).scalar()
@@ -25,6 +15,7 @@ def cadastrar_usuario(nome, username, senha, email, perfil="usuario"):
         return
 
     senha_hash = bcrypt.hashpw(senha.encode(), bcrypt.gensalt()).decode()
+    engine = conectar()
     query = text("""
         INSERT INTO usuarios (nome, username, senha_hash, email, perfil)
         VALUES (:nome, :username, :senha_hash, :email, :perfil)
@@ -43,6 +34,7 @@ def cadastrar_usuario(nome, username, senha, email, perfil="usuario"):
         print("❌ Erro ao criar usuário:", e)
 
 def autenticar_usuario(username, senha_digitada):
+    engine = conectar()
     query = text("SELECT * FROM usuarios WHERE username = :username AND ativo = TRUE")
     with engine.connect() as conn:
         result = conn.execute(query, {"username": username}).mappings().fetchone()